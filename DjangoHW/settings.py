@@ -53,6 +53,7 @@ MIDDLEWARE = [
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.common.CommonMiddleware',
     'corsheaders.middleware.CorsMiddleware',
+    'user.middleware.JwtAuthenticationMiddleware',
     #'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
@@ -86,15 +87,110 @@ TEMPLATES = [
 
 WSGI_APPLICATION = 'DjangoHW.wsgi.application'
 
+ASGI_APPLICATION = 'DjangoHW.asgi.application'
+
+
+# Real-time message fan-out
+# InMemoryFanout only reaches subscribers in the same process, UnixSocketFanout
+# broadcasts across all worker processes on this host.
+
+MESSAGE_FANOUT = {
+    'BACKEND': os.getenv(
+        "MESSAGE_FANOUT_BACKEND",
+        'message.fanout.UnixSocketFanout' if os.getenv("DEPLOY") else 'message.fanout.InMemoryFanout'
+    ),
+    'OPTIONS': {
+        'socket_dir': os.getenv("MESSAGE_FANOUT_SOCKET_DIR", '/tmp/rtc-fanout'),  # UnixSocketFanout only
+    },
+}
+
+
+# Friend graph cache (friend.graph)
+# Friend sets are cached per process; set a CACHES alias here to also share them
+# between worker processes, e.g. a memcached or redis cache.
+
+FRIEND_GRAPH_CACHE = os.getenv("FRIEND_GRAPH_CACHE") or None
+
 
 # Database
 # https://docs.djangoproject.com/en/4.1/ref/settings/#databases
+#
+# Configured from the environment, e.g.
+#   DB_ENGINE=django.db.backends.mysql DB_NAME=app DB_USER=... DB_PASSWORD=... DB_HOST=... DB_PORT=3306
+# Read replicas are listed in DB_REPLICAS (comma separated aliases). Each alias
+# reads DB_<ALIAS>_NAME, DB_<ALIAS>_HOST, ... and falls back to the primary's values.
+# Locally, replicas can be plain SQLite files: DB_REPLICAS=replica DB_REPLICA_NAME=replica.sqlite3
+
+def database_from_env(prefix, fallback=None):
+    fallback = fallback or {}
+
+    def setting(key, default=''):
+        return os.getenv(prefix + key, fallback.get(key, default))
+
+    return {
+        'ENGINE': setting('ENGINE', 'django.db.backends.sqlite3'),
+        'NAME': setting('NAME', BASE_DIR / 'db.sqlite3'),
+        'USER': setting('USER'),
+        'PASSWORD': setting('PASSWORD'),
+        'HOST': setting('HOST'),
+        'PORT': setting('PORT'),
+        'CONN_MAX_AGE': int(os.getenv("DB_CONN_MAX_AGE", 60)),  # Persistent connections, in seconds
+        'CONN_HEALTH_CHECKS': True,  # Check persistent connections before reusing them
+    }
+
 
 DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
-    }  # Change to MySQL or other databases for your FINAL project
+    'default': database_from_env("DB_"),
+}
+
+DATABASE_REPLICAS = [alias.strip() for alias in os.getenv("DB_REPLICAS", "").split(",") if alias.strip()]
+
+for alias in DATABASE_REPLICAS:
+    DATABASES[alias] = database_from_env("DB_%s_" % alias.upper(), DATABASES['default'])
+    DATABASES[alias]['TEST'] = {'MIRROR': 'default'}  # Tests read replicas through the primary
+
+DATABASE_ROUTERS = ['utils.utils_db.ReplicaRouter']
+
+# PRAGMAs run on every new SQLite connection (utils.utils_db.configure_sqlite)
+SQLITE_PRAGMAS = {
+    'journal_mode': 'wal',  # Readers and the writer no longer block each other
+    'synchronous': 'normal',  # Safe with WAL, fsync only at checkpoints
+    'busy_timeout': int(os.getenv("DB_BUSY_TIMEOUT", 5000)),  # Milliseconds to wait for a lock
+    'cache_size': -64000,  # Page cache in KiB (negative value)
+    'mmap_size': 256 * 1024 * 1024,
+    'temp_store': 'memory',
+}
+
+
+# Message full-text search (message.search)
+# SQLite uses an FTS5 index maintained on send; other databases fall back to LIKE
+# queries limited to the user's conversations.
+
+MESSAGE_SEARCH = {
+    'BACKEND': 'message.search.SqliteFtsBackend' if DATABASES['default']['ENGINE'].endswith('sqlite3') else 'message.search.LikeBackend',
+    'OPTIONS': {},
+}
+
+
+# Password hashing
+# The PBKDF2 iteration count is the cost of every login; measure it with
+# `python -m benchmarks.bench_login`. Changing it rehashes passwords on next login.
+
+PASSWORD_HASH_ITERATIONS = int(os.getenv("PASSWORD_HASH_ITERATIONS", 390000))
+
+PASSWORD_HASHERS = [
+    'user.hashers.TunablePBKDF2PasswordHasher',
+]
+
+
+# Rate limiting (utils.utils_ratelimit)
+# LocalBackend keeps token buckets per process; with several uWSGI workers use
+# CacheBackend with a shared cache (OPTIONS: {'cache': '<CACHES alias>'}).
+
+RATE_LIMIT = {
+    'BACKEND': os.getenv("RATE_LIMIT_BACKEND", 'utils.utils_ratelimit.LocalBackend'),
+    'OPTIONS': {},
+    'IP_HEADER': os.getenv("RATE_LIMIT_IP_HEADER") or None,  # e.g. HTTP_X_REAL_IP behind a reverse proxy
 }
 
 
@@ -0,0 +1,62 @@
+"""
+Microbenchmark for JWT verification.
+
+Compares the original per-call verification (rebuild HMAC from SALT and decode
+the payload every time) with the precomputed HMAC state and the per-process
+verification cache in `utils.utils_jwt`.
+
+Usage: python -m benchmarks.bench_jwt [--number N]
+"""
+
+import argparse
+import hashlib
+import hmac
+import json
+import time
+import timeit
+
+from utils import utils_jwt
+from utils.utils_jwt import SALT, b64url_decode, b64url_encode, check_jwt_token, generate_jwt_token
+
+
+# The implementation before the verification cache, kept as the baseline
+def check_jwt_token_baseline(token):
+    try:
+        header_b64, payload_b64, signature_b64 = token.split(".")
+    except:
+        return None
+    payload_str = b64url_decode(payload_b64)
+    signature_str_check = header_b64 + "." + payload_b64
+    signature_check = hmac.new(SALT, signature_str_check.encode("utf-8"), digestmod=hashlib.sha256).digest()
+    if b64url_encode(signature_check) != signature_b64:
+        return None
+    payload = json.loads(payload_str)
+    if payload["exp"] < time.time():
+        return None
+    return payload["data"]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--number", type=int, default=100000)
+    args = parser.parse_args()
+
+    tokens = [generate_jwt_token(f"user{i}") for i in range(100)]
+    cases = [
+        ("baseline", check_jwt_token_baseline),
+        ("precomputed hmac", utils_jwt._verify_jwt_token),
+        ("cached", check_jwt_token),
+    ]
+    baseline = None
+    for name, fn in cases:
+        def run():
+            for token in tokens:
+                fn(token)
+        elapsed = timeit.timeit(run, number=args.number // len(tokens))
+        rate = args.number / elapsed
+        baseline = baseline or rate
+        print(f"{name:<18} {rate:>12,.0f} verifications/s  x{rate / baseline:.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+"""
+Login throughput benchmark for password hashing.
+
+For each PBKDF2 iteration count, measures how many password verifications
+(`user.passwords.verify_password`) one thread can do per second, and the
+throughput of concurrent async verifications (as done by the login view)
+together with the worst event loop stall while they run. Use it to pick
+`PASSWORD_HASH_ITERATIONS`: the cost should leave enough logins/s per worker
+for peak traffic.
+
+Usage: python -m benchmarks.bench_login [--iterations N [N ...]] [--logins N] [--concurrency N]
+"""
+
+import argparse
+import asyncio
+import os
+import time
+
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "DjangoHW.settings")
+
+import django  # noqa: E402
+
+django.setup()
+
+from asgiref.sync import sync_to_async  # noqa: E402
+from django.test import override_settings  # noqa: E402
+
+from user.passwords import hash_password, verify_password  # noqa: E402
+
+
+async def concurrent_logins(encoded, logins, concurrency):
+    stall = 0.0
+    running = True
+
+    async def ticker():  # 事件循环被阻塞时 sleep 会明显超时
+        nonlocal stall
+        while running:
+            start = time.perf_counter()
+            await asyncio.sleep(0.001)
+            stall = max(stall, time.perf_counter() - start - 0.001)
+
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def login():
+        async with semaphore:
+            await sync_to_async(verify_password, thread_sensitive=False)("123456", encoded)
+
+    tick = asyncio.ensure_future(ticker())
+    start = time.perf_counter()
+    await asyncio.gather(*(login() for _ in range(logins)))
+    elapsed = time.perf_counter() - start
+    running = False
+    await tick
+    return logins / elapsed, stall
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--iterations", type=int, nargs="+", default=[100000, 260000, 390000, 600000])
+    parser.add_argument("--logins", type=int, default=40)
+    parser.add_argument("--concurrency", type=int, default=os.cpu_count() or 1)
+    args = parser.parse_args()
+
+    print(f"{os.cpu_count()} CPU(s), concurrency {args.concurrency}")
+    for iterations in args.iterations:
+        with override_settings(PASSWORD_HASH_ITERATIONS=iterations):
+            encoded = hash_password("123456")
+            start = time.perf_counter()
+            for _ in range(args.logins):
+                verify_password("123456", encoded)
+            single = args.logins / (time.perf_counter() - start)
+            rate, stall = asyncio.run(concurrent_logins(encoded, args.logins, args.concurrency))
+        print(f"iterations {iterations:>7}  {1000 / single:7.1f} ms/login  {single:7.1f} logins/s/thread"
+              f"  async {rate:7.1f} logins/s  max loop stall {stall * 1000:5.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+"""
+Microbenchmark for JSON response rendering.
+
+Renders a friend-list sized payload with Django's JsonResponse (the previous
+implementation of `request_success`) and with the stdlib and orjson renderers
+in `utils.utils_request`.
+
+Usage: python -m benchmarks.bench_render [--friends N] [--number N]
+"""
+
+import argparse
+import datetime
+import os
+import timeit
+
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "DjangoHW.settings")
+
+import django  # noqa: E402
+
+django.setup()
+
+from django.http import JsonResponse  # noqa: E402
+
+from utils import utils_request  # noqa: E402
+from utils.utils_request import OrjsonRenderer, StdlibRenderer, request_success  # noqa: E402
+
+
+def request_success_baseline(data={}, status_code=200):
+    return JsonResponse({
+        "code": 0,
+        "info": "Succeed",
+        **data
+    },
+    headers={
+        "Access-Control-Allow-Origin": "*"
+    },
+    status=status_code)
+
+
+def friend_list(size):
+    now = datetime.datetime.now(datetime.timezone.utc)
+    return {
+        "friends_info": [{
+            "toUser": f"user{i}",
+            "remark": None,
+            "tag": None,
+            "created": now.strftime("%Y-%m-%d %H:%M:%S"),
+            "friend_info": {
+                "name": f"user{i}", "nick_name": f"nick{i}", "create_time": now, "introduction": "Hello",
+                "birthday": now.date(), "phone": "13800000000", "email": f"user{i}@example.com",
+                "portrait": None, "gender": 2, "age": None, "location": "Beijing"
+            }
+        } for i in range(size)]
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--friends", type=int, default=1000)
+    parser.add_argument("--number", type=int, default=200)
+    args = parser.parse_args()
+
+    data = friend_list(args.friends)
+    cases = [("JsonResponse", request_success_baseline, None), ("stdlib renderer", request_success, StdlibRenderer())]
+    if utils_request.orjson is not None:
+        cases.append(("orjson renderer", request_success, OrjsonRenderer()))
+    baseline = None
+    for name, fn, renderer in cases:
+        if renderer is not None:
+            utils_request.RENDERER = renderer
+        elapsed = timeit.timeit(lambda: fn(data), number=args.number)
+        rate = args.number / elapsed
+        baseline = baseline or rate
+        print(f"{name:<16} {rate:>10,.1f} responses/s  x{rate / baseline:.2f}")
+
+
+if __name__ == "__main__":
+    main()
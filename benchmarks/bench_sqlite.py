@@ -0,0 +1,107 @@
+"""
+Concurrent load test for the SQLite connection settings.
+
+Runs writer processes sending messages (`message.services.send_message`) and
+reader processes paging message history at the same time against a fresh
+SQLite file, first with SQLite's defaults and then with `settings.SQLITE_PRAGMAS`
+(WAL, synchronous=NORMAL, busy_timeout, ...). Reports throughput and the number of
+"database is locked" failures.
+
+Usage: python -m benchmarks.bench_sqlite [--writers N] [--readers N] [--seconds S]
+"""
+
+import argparse
+import multiprocessing
+import os
+import tempfile
+import time
+
+
+def worker(role, seconds, conversation_id, sender, results):
+    from django.db import OperationalError, close_old_connections, connections
+    from message.models import Message
+    from message.services import send_message
+
+    connections.close_all()  # Don't share the parent's connection after fork
+    done = errors = 0
+    deadline = time.monotonic() + seconds
+    while time.monotonic() < deadline:
+        try:
+            if role == "writer":
+                send_message(conversation_id, sender, "load test message")
+            else:
+                list(Message.objects.filter(conversation_id=conversation_id).order_by("-sent_at", "-id")[:50])
+            done += 1
+        except OperationalError:  # database is locked
+            errors += 1
+            close_old_connections()
+    results.put((role, done, errors))
+
+
+def run(tuned, db_name, args, output):
+    os.environ["DB_NAME"] = db_name
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "DjangoHW.settings")
+    import django
+    from django.conf import settings
+
+    django.setup()
+    if not tuned:
+        settings.SQLITE_PRAGMAS = {}
+
+    from django.core.management import call_command
+    from django.db import connection, connections
+    from message.models import Conversation, Participant
+    from user.models import User
+
+    call_command("migrate", run_syncdb=True, verbosity=0)
+    senders = [User.objects.create(name=f"writer{i}", password="x") for i in range(args.writers)]
+    conversation = Conversation.objects.create(is_group=True)
+    Participant.objects.bulk_create([Participant(user=user, conversation=conversation) for user in senders])
+    with connection.cursor() as cursor:
+        cursor.execute("PRAGMA journal_mode")
+        journal_mode = cursor.fetchone()[0]
+    connections.close_all()
+
+    fork = multiprocessing.get_context("fork")
+    results = fork.Queue()
+    roles = [("writer", user.name) for user in senders] + [("reader", None)] * args.readers
+    processes = [fork.Process(target=worker, args=(role, args.seconds, conversation.id, sender, results))
+                 for role, sender in roles]
+    for process in processes:
+        process.start()
+    totals = {"writer": [0, 0], "reader": [0, 0]}
+    for _ in processes:
+        role, done, errors = results.get()
+        totals[role][0] += done
+        totals[role][1] += errors
+    for process in processes:
+        process.join()
+    output.put((journal_mode, totals))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--writers", type=int, default=4)
+    parser.add_argument("--readers", type=int, default=4)
+    parser.add_argument("--seconds", type=float, default=5)
+    args = parser.parse_args()
+
+    # Each run gets its own interpreter so settings and connections start clean
+    spawn = multiprocessing.get_context("spawn")
+    baseline = None
+    with tempfile.TemporaryDirectory() as tmp:
+        for name, tuned in (("defaults", False), ("SQLITE_PRAGMAS", True)):
+            output = spawn.Queue()
+            process = spawn.Process(target=run, args=(tuned, os.path.join(tmp, f"{name}.sqlite3"), args, output))
+            process.start()
+            journal_mode, totals = output.get()
+            process.join()
+            writes = totals["writer"][0] / args.seconds
+            reads = totals["reader"][0] / args.seconds
+            baseline = baseline or writes or 1
+            print(f"{name:<15} journal={journal_mode:<7} writes {writes:>9,.1f}/s  x{writes / baseline:.2f}"
+                  f"  reads {reads:>9,.1f}/s  locked errors {totals['writer'][1] + totals['reader'][1]}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,23 @@
+import pytest
+from django.core.cache import cache
+
+from friend.graph import clear_friend_graph_cache
+from user.cache import clear_user_cache
+from utils.utils_jwt import clear_jwt_cache
+from utils.utils_ratelimit import reset_rate_limits
+
+
+# 进程内缓存与本地缓存后端不随测试数据库回滚，每个测试前清空
+@pytest.fixture(autouse=True)
+def clear_process_caches():
+    clear_user_cache()
+    clear_friend_graph_cache()
+    clear_jwt_cache()
+    reset_rate_limits()
+    cache.clear()
+
+
+# 测试中使用低代价的密码哈希，避免拖慢注册 / 登录相关测试
+@pytest.fixture(autouse=True)
+def fast_password_hashing(settings):
+    settings.PASSWORD_HASH_ITERATIONS = 1000
@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class FriendConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "friend"
+
+    def ready(self):
+        import friend.signals  # noqa: F401  注册信号处理函数
@@ -0,0 +1,94 @@
+import sys
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+
+from friend.models import Friendship
+
+# 好友关系图缓存：用户名 -> 好友集合（frozenset，用户名经 sys.intern 驻留，各集合共享同一字符串）
+# 查询顺序：进程内 LRU -> 共享缓存（settings.FRIEND_GRAPH_CACHE，可选）-> 数据库
+# 同进程内的修改通过信号失效，其他进程的修改最多延迟 FRIEND_GRAPH_TTL 秒可见（共享缓存同样以此过期）
+FRIEND_GRAPH_TTL = 30
+FRIEND_GRAPH_SIZE = 10000
+SHARED_KEY_PREFIX = "friend-graph:"
+
+_friend_sets = OrderedDict()
+_friend_sets_lock = threading.Lock()
+
+
+def _shared_cache():
+    alias = getattr(settings, "FRIEND_GRAPH_CACHE", None)
+    return caches[alias] if alias else None
+
+
+def _load_friends(user_name):
+    shared = _shared_cache()
+    if shared is not None:
+        names = shared.get(SHARED_KEY_PREFIX + user_name)
+        if names is not None:
+            return frozenset(map(sys.intern, names))
+    names = list(Friendship.objects.filter(from_user_id=user_name).values_list("to_user_id", flat=True))
+    if shared is not None:
+        # 有限的过期时间：若写入晚于其他进程提交后的失效，旧数据最多保留 FRIEND_GRAPH_TTL 秒
+        shared.set(SHARED_KEY_PREFIX + user_name, names, FRIEND_GRAPH_TTL)
+    return frozenset(map(sys.intern, names))
+
+
+# 用户的好友集合（只读）
+def get_friends(user_name):
+    now = time.monotonic()
+    with _friend_sets_lock:
+        cached = _friend_sets.get(user_name)
+        if cached is not None and cached[0] > now:
+            _friend_sets.move_to_end(user_name)
+            return cached[1]
+
+    friends = _load_friends(user_name)
+    with _friend_sets_lock:
+        _friend_sets[user_name] = (now + FRIEND_GRAPH_TTL, friends)
+        _friend_sets.move_to_end(user_name)
+        if len(_friend_sets) > FRIEND_GRAPH_SIZE:
+            _friend_sets.popitem(last=False)
+    return friends
+
+
+# friend_name 是否在 user_name 的好友列表中，O(1)
+def are_friends(user_name, friend_name):
+    return friend_name in get_friends(user_name)
+
+
+# 共同好友，O(min(度数))
+def mutual_friends(user_name, other_name):
+    friends, others = get_friends(user_name), get_friends(other_name)
+    if len(friends) > len(others):
+        friends, others = others, friends
+    return {name for name in friends if name in others}
+
+
+def friend_count(user_name):
+    return len(get_friends(user_name))
+
+
+def _invalidate(user_names):
+    with _friend_sets_lock:
+        for user_name in user_names:
+            _friend_sets.pop(user_name, None)
+    shared = _shared_cache()
+    if shared is not None:
+        shared.delete_many([SHARED_KEY_PREFIX + user_name for user_name in user_names])
+
+
+# 好友关系变化后使缓存失效：立即失效一次，事务提交后再失效一次，
+# 避免提交前被其他请求以旧数据重新填充
+def invalidate_friends(*user_names):
+    _invalidate(user_names)
+    transaction.on_commit(lambda: _invalidate(user_names))
+
+
+def clear_friend_graph_cache():
+    with _friend_sets_lock:
+        _friend_sets.clear()
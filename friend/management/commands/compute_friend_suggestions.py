@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from friend.suggestions import SUGGESTIONS_PER_USER, compute_suggestions
+
+
+class Command(BaseCommand):
+    help = "重新计算好友推荐（建议定时执行，如每小时一次）"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--limit", type=int, default=SUGGESTIONS_PER_USER, help="每个用户保留的推荐数")
+
+    def handle(self, *args, **options):
+        count = compute_suggestions(limit=options["limit"])
+        self.stdout.write(f"Computed {count} friend suggestions")
@@ -1,7 +1,12 @@
-from django.db import models
+from django.db import models, transaction
+from django.dispatch import Signal
 from user.models import User
 from django.utils import timezone
 
+# 批量写入不触发 post_save，以下信号由对应操作显式发送（在同一事务中）
+friendships_created = Signal() # 参数 friendships：新建的好友关系列表
+friend_request_status_changed = Signal() # 参数 instance：状态已更新的好友申请
+
 
 # Create your models here.
 # 好友关系表
@@ -12,25 +17,50 @@ class Friendship(models.Model):
     tag = models.CharField(max_length=100, null=True) # 用户标签
     created = models.DateTimeField(auto_now_add=True) # 好友关系创建时间
     
-    def friend_profile(self): # 好友信息
+    def relation_info(self): # 好友关系本身的信息，不含好友资料
         return {
-            "toUser": self.to_user.name,
+            "toUser": self.to_user_id,
             "remark": self.remark,
             "tag": self.tag,
-            "created": self.created.strftime("%Y-%m-%d %H:%M:%S"),
-            "friend_info": self.to_user.serialize()
+            "created": self.created.strftime("%Y-%m-%d %H:%M:%S")
+        }
+
+    def friend_profile(self, fields=None): # 好友信息，需 select_related('to_user')；fields 为好友资料的字段投影
+        return {
+            **self.relation_info(),
+            "friend_info": self.to_user.serialize(fields)
         }
     class Meta: # 确保(from_user, to_user)有序对是唯一的
         unique_together = ('from_user', 'to_user')
 
 
+# 好友推荐表：由 `python manage.py compute_friend_suggestions` 离线批量计算，
+# 按共同好友数（score）排序，接口直接读表
+class FriendSuggestion(models.Model):
+    user = models.ForeignKey(User, related_name='friend_suggestions', on_delete=models.CASCADE) # 被推荐的用户
+    suggested = models.ForeignKey(User, related_name='+', on_delete=models.CASCADE) # 推荐给他的用户
+    score = models.IntegerField() # 共同好友数
+    computed_at = models.DateTimeField(auto_now_add=True) # 计算时间
+
+    class Meta:
+        unique_together = ('user', 'suggested')
+        indexes = [models.Index(fields=["user", "-score"])]
+
+    def serialize(self): # 需 select_related('suggested')
+        return {
+            "userInfo": self.suggested.__info__(),
+            "mutualFriendCount": self.score
+        }
+
+
 #好友申请表
 class FriendRequest(models.Model):
+    PENDING, ACCEPTED, DECLINED = 0, 1, 2
     from_user = models.ForeignKey(User, related_name='sent_requests', on_delete=models.CASCADE) # 申请用户
     to_user = models.ForeignKey(User, related_name='received_requests', on_delete=models.CASCADE) # 被申请用户
     update_time = models.DateTimeField(default=timezone.now) # 申请时间
     update_message = models.CharField(max_length=250, null=True) # 最后一条申请消息
-    status = models.CharField(max_length=10, choices=((0, 'Pending'), (1, 'Accepted'), (2, 'Declined'))) # 申请状态：等待、成功、被拒绝
+    status = models.IntegerField(default=PENDING, choices=((PENDING, 'Pending'), (ACCEPTED, 'Accepted'), (DECLINED, 'Declined'))) # 申请状态：等待、成功、被拒绝
 
     def from_user_profile(self): # 申请用户信息
         return {
@@ -46,7 +76,7 @@ class FriendRequest(models.Model):
             "status": self.status
         }
     
-    def __str__(self):
+    def serialize(self): # 序列化，需 select_related('from_user', 'to_user')
         return{
             "fromUser": self.from_user_profile(),
             "toUser": self.to_user_profile(),
@@ -55,30 +85,54 @@ class FriendRequest(models.Model):
             "status": self.status
         }
 
+    def __str__(self):
+        return f"{self.from_user_id} -> {self.to_user_id}"
+
+    # 处理申请（accept / reject）所需的字段，包括事件日志用到的字段，加载时 only(*TRANSITION_FIELDS) 避免延迟加载
+    TRANSITION_FIELDS = ("id", "from_user", "to_user", "update_message", "update_time")
+
+    def event_payload(self): # 事件日志中的申请信息，不需要加载用户
+        return {
+            "id": self.id,
+            "fromUser": self.from_user_id,
+            "toUser": self.to_user_id,
+            "status": self.status,
+            "updateMessage": self.update_message,
+            "updateTime": self.update_time
+        }
+
+    # 状态只能从等待中变更：以带条件的 UPDATE 完成检查与修改，并发请求中只有一个能成功
+    def _transition(self, status):
+        updated = FriendRequest.objects.filter(id=self.id, status=self.PENDING).update(status=status)
+        if updated:
+            self.status = status
+            friend_request_status_changed.send(sender=FriendRequest, instance=self)
+        return bool(updated)
+
     def accept(self): # 接受申请
-        if self.status == 1: return False # 已经被接受，不能再次接受
-        else: # 未被接受
-            self.status = 1
-            self.save()
-            # 建立好友关系
-            friendship1 = Friendship(from_user=self.to_user, to_user=self.from_user)
-            friendship2 = Friendship(from_user=self.from_user, to_user=self.to_user)
-            friendship1.save()
-            friendship2.save()
-            return True
+        with transaction.atomic():
+            if not self._transition(self.ACCEPTED):
+                return False # 已经被接受或拒绝，不能再次接受
+            # 建立双向好友关系，已存在的关系忽略
+            friendships = Friendship.objects.bulk_create([
+                Friendship(from_user_id=self.to_user_id, to_user_id=self.from_user_id),
+                Friendship(from_user_id=self.from_user_id, to_user_id=self.to_user_id)
+            ], ignore_conflicts=True)
+            friendships_created.send(sender=Friendship, friendships=friendships)
+        return True
 
     def reject(self): # 拒绝申请
-        if self.status == 0:   
-            self.status = 2
-            self.save()
-            return True
-        return False # 已经被接受或拒绝，不能再次拒绝
+        with transaction.atomic():
+            return self._transition(self.DECLINED) # 已经被接受或拒绝，不能再次拒绝
     ## Q:拒绝申请之后，还可以再次申请，但不记录申请曾被拒绝？
 
-    def _update_message_(self, message):
+    def _update_message_(self, message): # 再次申请，重新进入等待状态
         self.update_message = message
         self.update_time = timezone.now()
-        self.save()
+        if self.status == self.DECLINED:
+            self.status = self.PENDING
+        with transaction.atomic():
+            self.save()
 
 
 # 好友申请信息
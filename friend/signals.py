@@ -0,0 +1,17 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from friend.graph import invalidate_friends
+from friend.models import Friendship, friendships_created
+
+
+# 好友关系增删后使好友关系图缓存失效
+@receiver(post_save, sender=Friendship)
+@receiver(post_delete, sender=Friendship)
+def invalidate_friend_graph(sender, instance, **kwargs):
+    invalidate_friends(instance.from_user_id)
+
+
+@receiver(friendships_created, sender=Friendship)
+def invalidate_friend_graph_bulk(sender, friendships, **kwargs):
+    invalidate_friends(*{friendship.from_user_id for friendship in friendships})
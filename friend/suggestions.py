@@ -0,0 +1,45 @@
+import heapq
+from collections import defaultdict
+
+from django.db import transaction
+
+from friend.models import FriendSuggestion, Friendship
+
+# 好友推荐：好友的好友按共同好友数打分
+# 一次查询取出全部好友关系建立邻接集合，之后全部在内存中计算
+SUGGESTIONS_PER_USER = 20
+
+
+def load_friend_graph():
+    graph = defaultdict(set)
+    for from_user, to_user in Friendship.objects.values_list("from_user_id", "to_user_id").iterator(chunk_size=10000):
+        graph[from_user].add(to_user)
+    return graph
+
+
+# 为单个用户计算推荐：[(共同好友数, 用户名)]，按分数从高到低
+def suggest_for(graph, user_name, limit=SUGGESTIONS_PER_USER):
+    friends = graph.get(user_name, ())
+    scores = defaultdict(int)
+    for friend in friends:
+        for candidate in graph.get(friend, ()):
+            scores[candidate] += 1
+    scores.pop(user_name, None)
+    for friend in friends: # 已经是好友的不再推荐
+        scores.pop(friend, None)
+    # 分数相同时按用户名排序，结果稳定
+    return heapq.nsmallest(limit, ((-score, name) for name, score in scores.items()))
+
+
+# 重新计算所有用户的推荐并整表替换，返回写入的推荐条数
+def compute_suggestions(limit=SUGGESTIONS_PER_USER, batch_size=1000):
+    graph = load_friend_graph()
+    suggestions = [
+        FriendSuggestion(user_id=user_name, suggested_id=name, score=-score)
+        for user_name in graph
+        for score, name in suggest_for(graph, user_name, limit)
+    ]
+    with transaction.atomic():
+        FriendSuggestion.objects.all().delete()
+        FriendSuggestion.objects.bulk_create(suggestions, batch_size=batch_size)
+    return len(suggestions)
@@ -1,5 +1,354 @@
-from django.test import TestCase
+import io
+import json
+from unittest import mock
+from urllib.parse import urlencode
+
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from user.models import User
-from friend.models import Friendship
+from friend.graph import FRIEND_GRAPH_TTL, are_friends, clear_friend_graph_cache, friend_count, get_friends, mutual_friends
+from friend.models import FriendRequest, FriendSuggestion, Friendship
+from friend.suggestions import load_friend_graph, suggest_for
+
+# Create your tests here.
+class FriendListQueryTests(TestCase):
+    # Initializer
+    def setUp(self):
+        self.user = User.objects.create(name="Ashitemaru", password="123456")
+
+    def _add_friends(self, count):
+        friends = User.objects.bulk_create([User(name=f"Friend{i}", password="123456") for i in range(count)])
+        Friendship.objects.bulk_create([Friendship(from_user=self.user, to_user=friend) for friend in friends])
+        FriendRequest.objects.bulk_create([FriendRequest(from_user=friend, to_user=self.user, status=0) for friend in friends])
+        FriendRequest.objects.bulk_create([FriendRequest(from_user=self.user, to_user=friend, status=0) for friend in friends])
+
+    def _get(self, path, **headers):
+        with CaptureQueriesContext(connection) as queries:
+            res = self.client.generic("GET", path, json.dumps({"userName": "Ashitemaru"}), content_type="application/json", **headers)
+        self.assertEqual(res.status_code, 200)
+        return res.json(), len(queries)
+
+    def _check_query_count(self, count):
+        self._add_friends(count)
+        data, queries = self._get("/friend/?limit=1000")
+        self.assertEqual(len(data["friends_info"]), min(count, 1000))
+        self.assertEqual(queries, 2) # ETag 聚合 + 一页好友
+        data, queries = self._get("/friend/request/")
+        self.assertEqual(len(data["requests"]), count)
+        self.assertEqual(len(data["applys"]), count)
+        self.assertEqual(queries, 2)
+
+    # ! Test section
+    def test_query_count_10_friends(self):
+        self._check_query_count(10)
+
+    def test_query_count_1000_friends(self):
+        self._check_query_count(1000)
+
+    def test_query_count_10000_friends(self):
+        self._check_query_count(10000)
+
+    def test_friend_list_content(self):
+        friend = User.objects.create(name="Friend", password="123456", email="friend@example.com")
+        Friendship.objects.create(from_user=self.user, to_user=friend, remark="Buddy")
+        data, _ = self._get("/friend/")
+        self.assertEqual(data["friends_info"][0]["toUser"], "Friend")
+        self.assertEqual(data["friends_info"][0]["remark"], "Buddy")
+        self.assertEqual(data["friends_info"][0]["friend_info"]["email"], "friend@example.com")
+
+
+class FriendListPaginationTests(TestCase):
+    # Initializer
+    def setUp(self):
+        self.user = User.objects.create(name="Ashitemaru", password="123456")
+        for i in range(5):
+            friend = User.objects.create(name=f"Friend{i}", password="123456", phone=f"1380000000{i}")
+            Friendship.objects.create(from_user=self.user, to_user=friend)
+
+    def _get(self, query="", **headers):
+        return self.client.generic("GET", "/friend/" + query, json.dumps({"userName": "Ashitemaru"}), content_type="application/json", **headers)
+
+    # ! Test section
+    def test_cursor_pagination(self):
+        names = []
+        query = "?limit=2"
+        while True:
+            res = self._get(query)
+            names += [friend["toUser"] for friend in res.json()["friends_info"]]
+            if res.json()["nextCursor"] is None:
+                break
+            query = "?" + urlencode({"limit": 2, "cursor": res.json()["nextCursor"]})
+        self.assertEqual(names, [f"Friend{i}" for i in range(5)])
+
+    def test_field_projection(self):
+        with CaptureQueriesContext(connection) as queries:
+            res = self._get("?fields=name,portrait")
+        self.assertEqual(len(queries), 2)
+        self.assertEqual(res.json()["friends_info"][0]["friend_info"], {"name": "Friend0", "portrait": None})
+
+    def test_bad_field_projection(self):
+        res = self._get("?fields=name,password")
+        self.assertEqual(res.status_code, 400)
+        self.assertEqual(res.json()["info"], "Bad param [fields]")
+
+    def test_etag(self):
+        res = self._get()
+        etag = res["ETag"]
+        res = self._get(HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(res.status_code, 304)
+
+        # 好友资料更新后 ETag 变化
+        friend = User.objects.get(name="Friend3")
+        friend.nick_name = "Three"
+        friend.save()
+        res = self._get(HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(res.status_code, 200)
+        self.assertNotEqual(res["ETag"], etag)
+
+        # 删除好友后 ETag 变化
+        etag = res["ETag"]
+        Friendship.objects.filter(to_user_id="Friend0").delete()
+        self.assertEqual(self._get(HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+
+class FriendRequestTests(TestCase):
+    # Initializer
+    def setUp(self):
+        self.alice = User.objects.create(name="Alice", password="123456")
+        self.bob = User.objects.create(name="Bob", password="123456")
+        self.friend_request = FriendRequest.objects.create(from_user=self.bob, to_user=self.alice)
+
+    def _post(self, url, applier):
+        return self.client.post(url, {"userName": "Alice", "applierName": applier}, content_type="application/json")
+
+    # ! Test section
+    def test_accept(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.assertTrue(self.friend_request.accept())
+        # 一条带条件的 UPDATE 与一条批量 INSERT（不计 SAVEPOINT 与事件日志）
+        self.assertEqual(len([q for q in queries if "SAVEPOINT" not in q["sql"] and "message_event" not in q["sql"]]), 2)
+        self.assertEqual(FriendRequest.objects.get(id=self.friend_request.id).status, FriendRequest.ACCEPTED)
+        self.assertEqual(set(Friendship.objects.values_list("from_user_id", "to_user_id")), {("Alice", "Bob"), ("Bob", "Alice")})
+
+        # 同一申请的另一个副本（模拟并发请求）无法再次接受或拒绝
+        stale = FriendRequest.objects.get(id=self.friend_request.id)
+        stale.status = FriendRequest.PENDING
+        self.assertFalse(stale.accept())
+        self.assertFalse(stale.reject())
+        self.assertEqual(Friendship.objects.count(), 2)
+
+    def test_accept_view_loads_request_once(self):
+        FriendRequest.objects.create(from_user=User.objects.create(name="Carol", password="123456"), to_user=self.alice)
+        for url, applier in (("/friend/accept/", "Bob"), ("/friend/reject/", "Carol")):
+            with CaptureQueriesContext(connection) as queries:
+                self.assertEqual(self._post(url, applier).json()["code"], 0)
+            # 事件日志所需字段随申请一起加载，没有额外的延迟查询
+            selects = [q for q in queries if q["sql"].startswith("SELECT") and "friend_friendrequest" in q["sql"]]
+            self.assertEqual(len(selects), 1)
+
+    def test_accept_existing_friendship(self):
+        Friendship.objects.create(from_user=self.alice, to_user=self.bob)
+        self.assertTrue(self.friend_request.accept())
+        self.assertEqual(Friendship.objects.count(), 2)
+
+    def test_reject_and_reapply(self):
+        res = self._post("/friend/reject/", "Bob")
+        self.assertEqual(res.json()["code"], 0)
+        self.assertEqual(self._post("/friend/accept/", "Bob").status_code, 403)
+
+        # 再次申请后重新进入等待状态
+        FriendRequest.objects.get(id=self.friend_request.id)._update_message_("Hi again")
+        self.assertEqual(self._post("/friend/accept/", "Bob").json()["code"], 0)
+        self.assertTrue(Friendship.objects.filter(from_user=self.alice, to_user=self.bob).exists())
+        self.assertEqual(self._post("/friend/accept/", "Nobody").json()["code"], 2)
+
+
+class FriendGraphTests(TestCase):
+    # Initializer
+    def setUp(self):
+        self.users = [User.objects.create(name=name, password="123456") for name in ("Alice", "Bob", "Carol", "Dave")]
+        for a, b in [("Alice", "Bob"), ("Alice", "Carol"), ("Bob", "Carol")]:
+            Friendship.objects.create(from_user_id=a, to_user_id=b)
+            Friendship.objects.create(from_user_id=b, to_user_id=a)
+
+    # ! Test section
+    def test_queries(self):
+        self.assertTrue(are_friends("Alice", "Bob"))
+        with self.assertNumQueries(0): # 命中缓存
+            self.assertTrue(are_friends("Alice", "Carol"))
+            self.assertFalse(are_friends("Alice", "Dave"))
+            self.assertEqual(friend_count("Alice"), 2)
+        self.assertEqual(mutual_friends("Alice", "Bob"), {"Carol"})
+        self.assertEqual(mutual_friends("Dave", "Alice"), set())
+
+    def test_invalidation(self):
+        self.assertFalse(are_friends("Alice", "Dave"))
+        FriendRequest.objects.create(from_user_id="Dave", to_user_id="Alice").accept() # 批量创建，显式失效
+        self.assertTrue(are_friends("Alice", "Dave"))
+        self.assertTrue(are_friends("Dave", "Alice"))
+        Friendship.objects.filter(from_user_id="Alice", to_user_id="Bob").delete()
+        self.assertFalse(are_friends("Alice", "Bob"))
+        User.objects.get(name="Carol").delete() # 级联删除
+        self.assertEqual(get_friends("Alice"), {"Dave"})
+
+    def test_mutations_ignore_stale_cache(self):
+        # 模拟其他进程的修改：绕过信号，本进程的缓存未失效
+        def post(url, friend_name):
+            data = {"userName": "Alice", "friendName": friend_name, "message": "Hi"}
+            return self.client.post(url, data, content_type="application/json").json()["code"]
+        self.assertFalse(are_friends("Alice", "Dave"))
+        Friendship.objects.bulk_create([Friendship(from_user_id="Alice", to_user_id="Dave")])
+        self.assertEqual(post("/friend/delete/", "Dave"), 0)
+        self.assertTrue(are_friends("Alice", "Bob"))
+        Friendship.objects.filter(from_user_id="Alice", to_user_id="Bob")._raw_delete(connection.alias)
+        self.assertEqual(post("/friend/add/", "Bob"), 0)
+
+    @override_settings(FRIEND_GRAPH_CACHE="default")
+    def test_shared_cache(self):
+        self.assertEqual(get_friends("Alice"), {"Bob", "Carol"})
+        clear_friend_graph_cache() # 模拟另一个进程
+        with self.assertNumQueries(0):
+            self.assertEqual(get_friends("Alice"), {"Bob", "Carol"})
+        Friendship.objects.create(from_user_id="Alice", to_user_id="Dave")
+        clear_friend_graph_cache()
+        self.assertEqual(get_friends("Alice"), {"Bob", "Carol", "Dave"})
+
+    @override_settings(FRIEND_GRAPH_CACHE="default")
+    def test_shared_cache_expires(self):
+        # 共享缓存必须有过期时间，否则失效之后写入的旧数据会一直保留
+        with mock.patch.object(cache, "set", wraps=cache.set) as cache_set:
+            get_friends("Alice")
+        self.assertEqual(cache_set.call_args.args[2], FRIEND_GRAPH_TTL)
+
+    def test_user_profile(self):
+        def get(target):
+            return self.client.generic("GET", "/friend/user/", json.dumps({"userName": "Alice", "friendName": target}), content_type="application/json")
+        res = get("Bob").json()
+        self.assertTrue(res["isFriend"])
+        self.assertIn("phone", res["userInfo"])
+        self.assertEqual(res["mutualFriendCount"], 1)
+        res = get("Dave").json()
+        self.assertFalse(res["isFriend"])
+        self.assertNotIn("phone", res["userInfo"])
+        self.assertEqual(get("Nobody").status_code, 404)
+
+    def test_friend_profile(self):
+        def get(target):
+            return self.client.generic("GET", "/friend/profile/", json.dumps({"userName": "Alice", "friendName": target}), content_type="application/json")
+        res = get("Bob").json()
+        self.assertEqual(res["toUser"], "Bob")
+        self.assertEqual(res["friend_info"]["name"], "Bob")
+        # 好友资料命中缓存，只查询好友关系
+        with self.assertNumQueries(1):
+            self.assertEqual(get("Bob").json(), res)
+        User.objects.filter(name="Bob").update(nick_name="Bobby") # 绕过信号，缓存仍为旧值
+        self.assertEqual(get("Bob").json()["friend_info"]["nick_name"], res["friend_info"]["nick_name"])
+        User.objects.get(name="Bob").save()
+        self.assertEqual(get("Bob").json()["friend_info"]["nick_name"], "Bobby")
+        self.assertEqual(get("Dave").status_code, 403)
+
+
+class FriendSuggestionTests(TestCase):
+    # Initializer
+    def setUp(self):
+        for name in ("Alice", "Bob", "Carol", "Dave", "Eve", "Frank"):
+            User.objects.create(name=name, password="123456")
+        # Dave 与 Alice 有两个共同好友（Bob、Carol），Eve 有一个（Carol），Frank 没有
+        for a, b in [("Alice", "Bob"), ("Alice", "Carol"), ("Bob", "Dave"), ("Carol", "Dave"), ("Carol", "Eve"), ("Eve", "Frank")]:
+            Friendship.objects.create(from_user_id=a, to_user_id=b)
+            Friendship.objects.create(from_user_id=b, to_user_id=a)
+
+    def _get(self, user_name="Alice"):
+        return self.client.generic("GET", "/friend/suggestions/", json.dumps({"userName": user_name}), content_type="application/json")
+
+    # ! Test section
+    def test_compute_and_serve(self):
+        call_command("compute_friend_suggestions", stdout=io.StringIO())
+        with self.assertNumQueries(1): # 推荐表一次查询，已成为好友的用户在查询中排除
+            res = self._get()
+        suggestions = res.json()["suggestions"]
+        self.assertEqual([(s["userInfo"]["name"], s["mutualFriendCount"]) for s in suggestions], [("Dave", 2), ("Eve", 1)])
+
+        # 重新计算会整表替换
+        self.assertEqual(FriendSuggestion.objects.filter(user_id="Alice").count(), 2)
+        call_command("compute_friend_suggestions", stdout=io.StringIO())
+        self.assertEqual(FriendSuggestion.objects.filter(user_id="Alice").count(), 2)
+
+    def test_skip_new_friends(self):
+        call_command("compute_friend_suggestions", stdout=io.StringIO())
+        FriendRequest.objects.create(from_user_id="Dave", to_user_id="Alice").accept()
+        names = [s["userInfo"]["name"] for s in self._get().json()["suggestions"]]
+        self.assertEqual(names, ["Eve"])
+        # 排除在分页之前：第一页仍是满的
+        res = self.client.generic("GET", "/friend/suggestions/?limit=1", json.dumps({"userName": "Alice"}), content_type="application/json")
+        self.assertEqual([s["userInfo"]["name"] for s in res.json()["suggestions"]], ["Eve"])
+
+    def test_suggest_for(self):
+        graph = load_friend_graph()
+        self.assertEqual(suggest_for(graph, "Frank"), [(-1, "Carol")])
+        self.assertEqual(suggest_for(graph, "Alice", limit=1), [(-2, "Dave")])
+
+
+class SearchUserTests(TestCase):
+    # Initializer
+    def setUp(self):
+        User.objects.create(name="alice", password="123456", nick_name="Wonderland", email="alice@example.com")
+        User.objects.create(name="malice", password="123456", nick_name="M", email="m@example.com")
+        User.objects.create(name="bob", password="123456", nick_name="alicia", phone="13800000000")
+        User.objects.create(name="carol", password="123456", nick_name="C", email="carol@example.com")
+
+    def _search(self, **params):
+        res = self.client.get("/friend/search/", data=params)
+        self.assertEqual(res.status_code, 200)
+        return res.json()
+
+    # ! Test section
+    def test_search_ranking(self):
+        data = self._search(keyword="alice")
+        # 用户名完全匹配 > 用户名包含（malice）；bob 的昵称 alicia 不包含 alice
+        self.assertEqual([user["name"] for user in data["users"]], ["alice", "malice"])
+        self.assertEqual(data["total"], 2)
+        self.assertNotIn("phone", data["users"][0])
+
+    def test_search_prefix(self):
+        data = self._search(keyword="Al")
+        self.assertEqual([user["name"] for user in data["users"]], ["alice", "bob"])
+
+    def test_search_other_fields(self):
+        self.assertEqual([user["name"] for user in self._search(keyword="1380")["users"]], ["bob"])
+        self.assertEqual([user["name"] for user in self._search(keyword="example.com")["users"]], ["alice", "carol", "malice"])
+
+    def test_search_pagination(self):
+        first = self._search(keyword="example.com", limit=2)
+        second = self._search(keyword="example.com", limit=2, page=1)
+        self.assertEqual([user["name"] for user in first["users"] + second["users"]], ["alice", "carol", "malice"])
+
+    def test_index_follows_profile_update(self):
+        user = User.objects.get(name="carol")
+        user.nick_name = "Wonderful"
+        user.save()
+        self.assertEqual([user["name"] for user in self._search(keyword="wonder")["users"]], ["alice", "carol"])
+
+    def test_rebuild_index(self):
+        User.objects.bulk_create([User(name="dave", password="123456")]) # bulk_create 不触发信号
+        self.assertEqual(self._search(keyword="dave")["total"], 0)
+        call_command("rebuild_user_search_index", stdout=io.StringIO())
+        self.assertEqual(self._search(keyword="dave")["total"], 1)
+
+    def test_search_ranks_before_paging(self):
+        # 候选很多时，精确匹配仍排在最前，总数准确
+        User.objects.bulk_create([
+            User(name=f"ab{i:04d}", password="123456", nick_name=f"ab{i}", email=f"ab{i}@example.com") for i in range(1400)
+        ])
+        User.objects.create(name="zzz", password="123456", nick_name="ab")
+        call_command("rebuild_user_search_index", stdout=io.StringIO())
+        data = self._search(keyword="ab", limit=1)
+        self.assertEqual([user["name"] for user in data["users"]], ["zzz"])
+        self.assertEqual(data["total"], 1401)
 
-# Create your tests here.
\ No newline at end of file
+    def test_search_bad_keyword(self):
+        res = self.client.get("/friend/search/", data={"keyword": ""})
+        self.assertEqual(res.status_code, 400)
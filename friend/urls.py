@@ -6,8 +6,10 @@ urlpatterns = [
     path('', views.get_friend_list), # 获取好友列表
     path('accept/', views.accept_friend_request), # 接受好友请求
     path('reject/', views.reject_friend_request), # 拒绝好友请求
-    # path('search', views.get_friend_list), # 搜索用户
+    path('search/', views.search_user), # 搜索用户
     path('profile/', views.get_friend_profile), # 获取好友资料
     path('request/', views.get_friend_request_list), # 显示好友请求列表
+    path('user/', views.get_user_profile), # 获取用户信息（好友可见完整资料）
+    path('suggestions/', views.get_friend_suggestions), # 好友推荐
     
 ]
\ No newline at end of file
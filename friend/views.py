@@ -1,65 +1,128 @@
 from django.shortcuts import render
-import json
+import hashlib
+from django.db import transaction
+from django.db.models import Count, Max
 from django.http import HttpRequest, HttpResponse
+from django.utils.http import parse_etags, quote_etag
 from django.shortcuts import redirect
 from user.models import User
-from friend.models import FriendRequest, Friendship, FriendRequestMessage
-from utils.utils_request import BAD_METHOD, request_failed, request_success, return_field
-from utils.utils_require import MAX_CHAR_LENGTH, CheckRequire, require
+from user.middleware import get_request_user, get_request_user_name
+from user.cache import get_cached_profile, get_cached_user
+from user.search import search_users
+from friend.graph import are_friends, mutual_friends
+from friend.models import FriendRequest, FriendSuggestion, Friendship, FriendRequestMessage
+from utils.utils_cursor import decode_cursor, encode_cursor, get_page_size
+from utils.utils_db import use_replica
+from utils.utils_request import (
+    BAD_METHOD, dumps_json, extend_json, request_failed, request_not_modified, request_success, request_success_json, return_field
+)
+from utils.utils_require import MAX_CHAR_LENGTH, CheckRequire, Field, Schema, parse_body, require
 from utils.utils_time import get_timestamp
 from utils.utils_jwt import generate_jwt_token, check_jwt_token
 
+FRIEND_PAGE_SIZE = 200 # 好友列表默认每页数量
+MAX_FRIEND_PAGE_SIZE = 1000
+SEARCH_PAGE_SIZE = 20 # 搜索结果每页数量
+MAX_SEARCH_PAGE_SIZE = 100
+SUGGESTION_PAGE_SIZE = 20 # 好友推荐数量
+MAX_SUGGESTION_PAGE_SIZE = 100
+
+# 请求体校验规则
+ADD_FRIEND_SCHEMA = Schema(
+    Field("friendName", "string", err_msg="Missing or error type of [friendName]"),
+    Field("message", "string", err_msg="Missing or error type of [message]"),
+)
+APPLIER_SCHEMA = Schema(Field("applierName", "string", err_msg="Missing or error type of [friendName]"))
+FRIEND_SCHEMA = Schema(Field("friendName", "string", err_msg="Missing or error type of [friendName]"))
+
 # Create your views here.
 # 获取好友列表
+# 查询参数：cursor 分页游标，limit 每页数量，fields 好友资料字段（逗号分隔，如 name,nick_name,portrait）
+# 支持 ETag / If-None-Match，列表未变化时返回 304
+@CheckRequire
+@use_replica
 def get_friend_list(req: HttpRequest):
     if req.method != "GET":
         return BAD_METHOD
     
-    body = json.loads(req.body.decode("utf-8")) 
-    user_name = require(body, "userName", "string", err_msg="Missing or error type of [userName]")
-    user = User.objects.get(name=user_name)
-    friend_list = Friendship.objects.filter(from_user=user)
+    body = parse_body(req)
+    user_name = get_request_user_name(req, body)
+    params = req.GET
+    limit = get_page_size(params, FRIEND_PAGE_SIZE, MAX_FRIEND_PAGE_SIZE)
+    fields = None
+    if params.get("fields"):
+        fields = params["fields"].split(",")
+        if not set(fields) <= set(User.SERIALIZE_FIELDS):
+            return request_failed(-1, "Bad param [fields]", 400)
+
+    friend_list = Friendship.objects.filter(from_user_id=user_name)
+
+    # 好友数、最新好友关系与最新资料更新时间任一变化都会改变 ETag
+    state = friend_list.aggregate(count=Count("id"), created=Max("created"), updated=Max("to_user__update_time"))
+    etag = quote_etag(hashlib.md5("|".join(map(str, (
+        user_name, state["count"], state["created"], state["updated"], params.get("cursor"), limit, fields
+    ))).encode("utf-8")).hexdigest())
+    if etag in parse_etags(req.headers.get("If-None-Match", "")):
+        return request_not_modified(etag)
+
+    if params.get("cursor"):
+        friend_list = friend_list.filter(id__gt=decode_cursor(params["cursor"], 1)[0])
+    # 一次查询取出好友关系与好友资料
+    friend_list = friend_list.select_related("to_user").order_by("id")
+    if fields is None:
+        friend_list = friend_list.defer("to_user__password")
+    else:
+        friend_list = friend_list.only("remark", "tag", "created", "to_user__name", *[f"to_user__{field}" for field in fields])
+    page = list(friend_list[:limit + 1])
+    next_cursor = encode_cursor(page[limit - 1].id) if len(page) > limit else None
 
     return_data = {
         "friends_info": [
-            friend.friend_profile() for friend in friend_list
-        ]
+            friend.friend_profile(fields) for friend in page[:limit]
+        ],
+        "nextCursor": next_cursor
     }
-    return request_success(return_data)
+    response = request_success(return_data)
+    response["ETag"] = etag
+    return response
 
 # 获取好友请求列表
+@CheckRequire
 def get_friend_request_list(req: HttpRequest):
     if req.method != "GET":
         return BAD_METHOD
-    body = json.loads(req.body.decode("utf-8"))
-    user_name = require(body, "userName", "string", err_msg="Missing or error type of [userName]")
-    user = User.objects.get(name=user_name)
-    friend_requests = FriendRequest.objects.filter(to_user=user)
-    friend_applys = FriendRequest.objects.filter(from_user=user)
+    body = parse_body(req)
+    user_name = get_request_user_name(req, body)
+    friend_requests = FriendRequest.objects.filter(to_user_id=user_name).select_related("from_user", "to_user")
+    friend_applys = FriendRequest.objects.filter(from_user_id=user_name).select_related("from_user", "to_user")
     return_data = {
         "requests": [
-            return_field(friend_request.__str__(), ["fromUser","updateTime","updateMessage","status"]) for friend_request in friend_requests
+            return_field(friend_request.serialize(), ["fromUser","updateTime","updateMessage","status"]) for friend_request in friend_requests
         ],
         "applys": [
-            return_field(friend_apply.__str__(), ["toUser","updateTime","updateMessage","status"]) for friend_apply in friend_applys
+            return_field(friend_apply.serialize(), ["toUser","updateTime","updateMessage","status"]) for friend_apply in friend_applys
         ]
     }
     return request_success(return_data)
 
 # 发送好友请求
+@CheckRequire
 def add_friend(req: HttpRequest):
     if req.method != "POST":
         return BAD_METHOD
     # 格式：{"userName": "123", "friendName": "Sam", "message": "Hi"}
-    body = json.loads(req.body.decode("utf-8"))
-    user_name = require(body, "userName", "string", err_msg="Missing or error type of [userName]")
-    friend_name = require(body, "friendName", "string", err_msg="Missing or error type of [friendName]")
-    user = User.objects.get(name=user_name)
+    body = parse_body(req)
+    user_name = get_request_user_name(req, body)
+    data = ADD_FRIEND_SCHEMA.parse(req)
+    friend_name, apply_message = data["friendName"], data["message"]
+    user = get_request_user(req, user_name)
+    if user is None:
+        return request_failed(1, "User not exist", 401)
     friend = User.objects.get(name=friend_name)
 
-    apply_message = require(body, "message", "string", err_msg="Missing or error type of [message]")
     if apply_message == "": apply_message = "你好，我是" + user.nick_name + "，很高兴认识你！" # 缺省值
 
+    # 写操作以数据库为准，好友关系缓存在其他进程中可能已过时
     if Friendship.objects.filter(from_user=user, to_user=friend).exists(): # 已经是好友
         return request_failed(1, "Already friends", 403)
     
@@ -72,19 +135,21 @@ def add_friend(req: HttpRequest):
     else : # 创建新的好友请求
         friend_request = FriendRequest(from_user=friend, to_user=user, update_message=apply_message)
         friend_request_message = FriendRequestMessage(request=friend_request, message=apply_message)
-        friend_request.save()
-        friend_request_message.save()
+        with transaction.atomic(): # 与事件日志一同提交
+            friend_request.save()
+            friend_request_message.save()
         return request_success({})
 ############
 # 接受好友请求
+@CheckRequire
 def accept_friend_request(req: HttpRequest):
     if req.method != "POST":
         return BAD_METHOD
-    body = json.loads(req.body.decode("utf-8"))
-    user_name = require(body, "userName", "string", err_msg="Missing or error type of [userName]")
-    friend_name = require(body, "applierName", "string", err_msg="Missing or error type of [friendName]")
-    if FriendRequest.objects.filter(to_user=user_name, from_user=friend_name).exists():
-        friend_request = FriendRequest.objects.get(to_user=user_name, from_user=friend_name)
+    body = parse_body(req)
+    user_name = get_request_user_name(req, body)
+    friend_name = APPLIER_SCHEMA.parse(req)["applierName"]
+    friend_request = FriendRequest.objects.filter(to_user=user_name, from_user=friend_name).only(*FriendRequest.TRANSITION_FIELDS).first()
+    if friend_request is not None:
         if friend_request.accept():
             return request_success({})
         else:
@@ -93,14 +158,15 @@ def accept_friend_request(req: HttpRequest):
         return request_failed(2, "Friend request not found", 403)
 
 # 拒绝好友请求
+@CheckRequire
 def reject_friend_request(req: HttpRequest):
     if req.method != "POST":
         return BAD_METHOD
-    body = json.loads(req.body.decode("utf-8"))
-    user_name = require(body, "userName", "string", err_msg="Missing or error type of [userName]")
-    friend_name = require(body, "applierName", "string", err_msg="Missing or error type of [friendName]")
-    if FriendRequest.objects.filter(to_user=user_name, from_user=friend_name).exists():
-        friend_request = FriendRequest.objects.get(to_user=user_name, from_user=friend_name)
+    body = parse_body(req)
+    user_name = get_request_user_name(req, body)
+    friend_name = APPLIER_SCHEMA.parse(req)["applierName"]
+    friend_request = FriendRequest.objects.filter(to_user=user_name, from_user=friend_name).only(*FriendRequest.TRANSITION_FIELDS).first()
+    if friend_request is not None:
         if friend_request.reject():
             return request_success({})
         else:
@@ -111,37 +177,48 @@ def reject_friend_request(req: HttpRequest):
     
 
 # 获取好友信息
+# 好友资料取自资料缓存（序列化好的 JSON），与好友关系信息拼接后返回
+@CheckRequire
 def get_friend_profile(req: HttpRequest):
     if req.method != "GET":
         return BAD_METHOD
-    body = json.loads(req.body.decode("utf-8"))
-    user_name = require(body, "userName", "string", err_msg="Missing or error type of [userName]")
-    friend_name = require(body, "friendName", "string", err_msg="Missing or error type of [friendName]")
-    user = User.objects.get(name=user_name)
-    friend = User.objects.get(name=friend_name)
-    friendship = Friendship.objects.get(from_user=user, to_user=friend)
-    if friendship:
-        return request_success(friendship.friend_profile())
-    else:
+    body = parse_body(req)
+    user_name = get_request_user_name(req, body)
+    friend_name = FRIEND_SCHEMA.parse(req)["friendName"]
+    user = get_request_user(req, user_name)
+    if user is None:
+        return request_failed(1, "User not exist", 401)
+    friendship = Friendship.objects.filter(from_user=user, to_user_id=friend_name).only(
+        "to_user", "remark", "tag", "created"
+    ).first()
+    friend_info = get_cached_profile(friend_name, "profile", User.serialize) if friendship else None
+    if friend_info is None:
         return request_failed(1, "Friend not foound", 403)
+    return request_success_json(extend_json(dumps_json(friendship.relation_info()), friend_info=friend_info))
 
+@CheckRequire
 def delete_friend(req: HttpRequest):
     if req.method != "POST":
         return BAD_METHOD
-    body = json.loads(req.body.decode("utf-8"))
-    user_name = require(body, "userName", "string", err_msg="Missing or error type of [userName]")
-    friend_name = require(body, "friendName", "string", err_msg="Missing or error type of [friendName]")
-    user = User.objects.get(name=user_name)
+    body = parse_body(req)
+    user_name = get_request_user_name(req, body)
+    friend_name = FRIEND_SCHEMA.parse(req)["friendName"]
+    user = get_request_user(req, user_name)
+    if user is None:
+        return request_failed(1, "User not exist", 401)
     friend = User.objects.get(name=friend_name)
     
-    if Friendship.objects.filter(from_user=user, to_user=friend).exists():
-        Friendship.objects.filter(from_user=user, to_user=friend).delete()
+    # 以删除的行数判断是否为好友，不依赖可能过时的好友关系缓存
+    deleted, _ = Friendship.objects.filter(from_user=user, to_user=friend).delete()
+    if deleted:
         return request_success({})
     else:
         return request_failed(1, "Friend not foound", 403)
-    return request_success({})
 
 # 搜索用户
+# GET /friend/search/?keyword=xxx&page=0&limit=20，按用户名、昵称、邮箱、手机号匹配并按相关度排序
+@CheckRequire
+@use_replica
 def search_user(req: HttpRequest):
     if req.method != "GET":
         return BAD_METHOD
@@ -149,20 +226,54 @@ def search_user(req: HttpRequest):
     keyword = require(params, "keyword", "string", err_msg="Missing or error type of [keyword]")
     if not 0 < len(keyword) <= MAX_CHAR_LENGTH:
         return request_failed(-1, "Bad param [keyword]", 400)
-    users = User.objects.filter(name__icontains=keyword).order_by('-created_time')
+    limit = get_page_size(params, SEARCH_PAGE_SIZE, MAX_SEARCH_PAGE_SIZE)
+    page = require(params, "page", "int", err_msg="Bad param [page]", err_code=-1) if "page" in params else 0
+    if page < 0:
+        return request_failed(-1, "Bad param [page]", 400)
+    users, total = search_users(keyword, page * limit, limit)
     return_data = {
         "users": [
-            return_field(user.serialize(), ["id", "name", "createdTime"]) for user in users
-        ]
+            user.__info__() for user in users
+        ],
+        "total": total
+    }
+    return request_success(return_data)
+
+# 好友推荐
+# GET /friend/suggestions/?limit=20，读取离线计算的推荐表，过滤掉计算之后已成为好友的用户
+@CheckRequire
+@use_replica
+def get_friend_suggestions(req: HttpRequest):
+    if req.method != "GET":
+        return BAD_METHOD
+    body = parse_body(req)
+    user_name = get_request_user_name(req, body)
+    limit = get_page_size(req.GET, SUGGESTION_PAGE_SIZE, MAX_SUGGESTION_PAGE_SIZE)
+    # 在分页之前排除已成为好友的用户，每页都是满的
+    suggestions = FriendSuggestion.objects.filter(user_id=user_name).exclude(
+        suggested_id__in=Friendship.objects.filter(from_user_id=user_name).values("to_user_id")
+    ).select_related("suggested").defer("suggested__password").order_by("-score", "suggested_id")[:limit]
+    return_data = {
+        "suggestions": [suggestion.serialize() for suggestion in suggestions]
     }
     return request_success(return_data)
 
 # 获取用户信息
-"""先检验是否为好友"""
+"""先检验是否为好友：好友可查看完整资料，否则只能查看公开信息"""
+@CheckRequire
 def get_user_profile(req: HttpRequest):
     if req.method != "GET":
         return BAD_METHOD
-    body = json.loads(req.body.decode("utf-8"))
-    user_name = require(body, "userName", "string", err_msg="Missing or error type of [userName]")
-    user = User.objects.get(name=user_name)
-    user_find = User.objects.filter(name=user_name).values_list('id', flat=True)
\ No newline at end of file
+    body = parse_body(req)
+    user_name = get_request_user_name(req, body)
+    target_name = FRIEND_SCHEMA.parse(req)["friendName"]
+    target = get_cached_user(target_name)
+    if target is None:
+        return request_failed(2, "User not found", 404)
+    is_friend = are_friends(user_name, target_name)
+    return_data = {
+        "userInfo": target.serialize() if is_friend else target.__info__(),
+        "isFriend": is_friend,
+        "mutualFriendCount": len(mutual_friends(user_name, target_name))
+    }
+    return request_success(return_data)
@@ -4,3 +4,14 @@ from django.apps import AppConfig
 class MessageConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "message"
+
+    def ready(self):
+        import message.signals  # noqa: F401  注册信号处理函数
+        from django.db.models.signals import post_migrate
+        post_migrate.connect(install_search_index, sender=self)
+
+
+# 全文索引的虚表不由模型管理，在 migrate（包括测试数据库的创建）之后建立
+def install_search_index(sender, using, **kwargs):
+    from message.search import get_search_backend
+    get_search_backend().install(using)
@@ -0,0 +1,108 @@
+import asyncio
+import json
+from urllib.parse import parse_qs
+
+from asgiref.sync import sync_to_async
+
+from message.fanout import get_fanout
+from message.models import Participant
+from utils.utils_jwt import check_jwt_token
+from utils.utils_request import dumps_json
+
+# 实时消息推送的 WebSocket 入口
+# 连接方式：ws://<host>/ws/message?token=<jwt>
+WEBSOCKET_PATH = "/ws/message"
+
+# 关闭码（4000 起为应用自定义）
+CLOSE_NOT_FOUND = 4404
+CLOSE_UNAUTHORIZED = 4401
+
+
+def _get_user_name(scope):
+    query = parse_qs(scope.get("query_string", b"").decode("utf-8"))
+    token = query.get("token", [None])[0]
+    if token is None:
+        return None
+    data = check_jwt_token(token)
+    if data is None:
+        return None
+    return data.get("username")
+
+
+@sync_to_async
+def _get_conversation_ids(user_name):
+    return list(Participant.objects.filter(user_id=user_name).values_list("conversation_id", flat=True))
+
+
+def _subscribe(conversation_ids, callback):
+    fanout = get_fanout()
+    for conversation_id in conversation_ids:
+        fanout.subscribe(conversation_id, callback)
+
+
+def _unsubscribe(conversation_ids, callback):
+    fanout = get_fanout()
+    for conversation_id in conversation_ids:
+        fanout.unsubscribe(conversation_id, callback)
+
+
+def _encode(payload):
+    return dumps_json(payload).decode("utf-8")
+
+
+async def websocket_application(scope, receive, send):
+    event = await receive()
+    if event["type"] != "websocket.connect":
+        return
+    if scope["path"] != WEBSOCKET_PATH:
+        await send({"type": "websocket.close", "code": CLOSE_NOT_FOUND})
+        return
+    user_name = _get_user_name(scope)
+    if user_name is None:
+        await send({"type": "websocket.close", "code": CLOSE_UNAUTHORIZED})
+        return
+
+    conversation_ids = await _get_conversation_ids(user_name)
+    await send({"type": "websocket.accept"})
+
+    loop = asyncio.get_running_loop()
+    queue = asyncio.Queue()
+
+    # 广播回调可能在其他线程中触发
+    def callback(payload):
+        try:
+            loop.call_soon_threadsafe(queue.put_nowait, payload)
+        except RuntimeError: # 事件循环已关闭
+            pass
+
+    _subscribe(conversation_ids, callback)
+    receiving = asyncio.ensure_future(receive())
+    pushing = asyncio.ensure_future(queue.get())
+    try:
+        await send({"type": "websocket.send", "text": _encode({"type": "subscribed", "conversations": conversation_ids})})
+        while True:
+            done, _ = await asyncio.wait({receiving, pushing}, return_when=asyncio.FIRST_COMPLETED)
+            if pushing in done:
+                await send({"type": "websocket.send", "text": _encode(pushing.result())})
+                pushing = asyncio.ensure_future(queue.get())
+            if receiving in done:
+                event = receiving.result()
+                if event["type"] == "websocket.disconnect":
+                    break
+                # 客户端加入新会话后可发送 {"type": "subscribe"} 刷新订阅
+                try:
+                    command = json.loads(event.get("text") or "{}")
+                except ValueError:
+                    command = {}
+                if command.get("type") == "subscribe":
+                    _unsubscribe(conversation_ids, callback)
+                    conversation_ids = await _get_conversation_ids(user_name)
+                    _subscribe(conversation_ids, callback)
+                    await send({"type": "websocket.send", "text": _encode({"type": "subscribed", "conversations": conversation_ids})})
+                elif command.get("type") == "ping":
+                    await send({"type": "websocket.send", "text": _encode({"type": "pong"})})
+                receiving = asyncio.ensure_future(receive())
+    finally:
+        _unsubscribe(conversation_ids, callback)
+        receiving.cancel()
+        pushing.cancel()
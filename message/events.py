@@ -0,0 +1,53 @@
+from datetime import timedelta
+
+from django.db import connections, router
+from django.db.models import Q
+from django.utils import timezone
+
+from message.models import Event, Participant
+
+# 事件日志的写入与读取
+# 写入由 message.signals 在变更发生时调用；变更本身需在 transaction.atomic 中进行
+# （send_message、好友申请的处理、QuerySet.delete 均是如此），事件因此与变更同时提交或回滚
+#
+# seq 在插入时分配而不是在提交时：SQLite 的写事务是串行的，seq 提交顺序与大小一致；
+# 其他数据库允许并发写入，seq 较大的事件可能先提交，读者若越过尚未提交的较小 seq 就会永久漏掉它。
+# 因此在这些数据库上只返回写入超过 EVENT_SETTLE_SECONDS 秒的事件（假定写事件的事务在此时间内完成），
+# 更新的事件留待下次拉取
+EVENT_SETTLE_SECONDS = 2
+
+
+def record_event(kind, payload, user_name=None, conversation_id=None):
+    return Event.objects.create(kind=kind, payload=payload, user_id=user_name, conversation_id=conversation_id)
+
+
+def record_events(events):
+    Event.objects.bulk_create([
+        Event(kind=kind, payload=payload, user_id=user_name, conversation_id=conversation_id)
+        for kind, payload, user_name, conversation_id in events
+    ])
+
+
+# 读取事件前需等待的时间，写入串行的数据库（SQLite）为 0
+def settle_delay(using):
+    return 0 if connections[using].vendor == "sqlite" else EVENT_SETTLE_SECONDS
+
+
+# 按 seq 顺序逐条产出 since 之后的事件，分批查询（每批一次索引范围扫描），内存占用与事件总数无关
+# 指定 user_name 时只返回该用户可见的事件：发给他的，以及他所在会话的
+def iter_events(since=0, user_name=None, chunk_size=500):
+    events = Event.objects.all()
+    if user_name is not None:
+        conversation_ids = list(Participant.objects.filter(user_id=user_name).values_list("conversation_id", flat=True))
+        events = events.filter(Q(user_id=user_name) | Q(conversation_id__in=conversation_ids))
+    delay = settle_delay(router.db_for_read(Event))
+    cutoff = timezone.now() - timedelta(seconds=delay) if delay else None
+    while True:
+        chunk = list(events.filter(seq__gt=since).order_by("seq")[:chunk_size])
+        for event in chunk:
+            if cutoff is not None and event.created_at > cutoff: # 在第一个过新的事件处停止，之后的事件也不返回
+                return
+            yield event
+        if len(chunk) < chunk_size:
+            return
+        since = chunk[-1].seq
@@ -0,0 +1,43 @@
+import csv
+
+from message.models import Message
+from utils.utils_request import dumps_json, format_datetime
+
+# 会话历史导出：按 (sent_at, id) 顺序分批读取并逐行产出，内存占用与消息总数无关
+EXPORT_FORMATS = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv",
+}
+EXPORT_FIELDS = ["id", "conversationId", "sender", "text", "quote", "sentAt"]
+EXPORT_CHUNK_SIZE = 2000
+
+
+def _rows(conversation_id, chunk_size):
+    messages = Message.objects.filter(conversation_id=conversation_id).order_by("sent_at", "id").values_list(
+        "id", "conversation_id", "sender_id", "text", "quote_id", "sent_at"
+    )
+    return messages.iterator(chunk_size=chunk_size)
+
+
+# csv.writer 写入的“文件”，直接返回写入的内容
+class _Echo:
+    def write(self, value):
+        return value
+
+
+def export_ndjson(conversation_id, chunk_size=EXPORT_CHUNK_SIZE):
+    for row in _rows(conversation_id, chunk_size):
+        yield dumps_json(dict(zip(EXPORT_FIELDS, row))) + b"\n"
+
+
+def export_csv(conversation_id, chunk_size=EXPORT_CHUNK_SIZE):
+    writer = csv.writer(_Echo())
+    yield writer.writerow(EXPORT_FIELDS).encode("utf-8")
+    for message_id, conversation, sender, text, quote, sent_at in _rows(conversation_id, chunk_size):
+        yield writer.writerow([message_id, conversation, sender, text, quote, format_datetime(sent_at)]).encode("utf-8")
+
+
+# 按格式产出导出内容（bytes）
+def export_conversation(conversation_id, format="ndjson", chunk_size=EXPORT_CHUNK_SIZE):
+    exporter = export_csv if format == "csv" else export_ndjson
+    return exporter(conversation_id, chunk_size)
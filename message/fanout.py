@@ -0,0 +1,144 @@
+import json
+import logging
+import os
+import socket
+import threading
+import uuid
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+from utils.utils_request import dumps_json
+
+logger = logging.getLogger(__name__)
+
+# 消息广播层：按 Conversation.id 将新消息分发给订阅者
+# 后端通过 settings.MESSAGE_FANOUT 配置：
+#   InMemoryFanout   仅在当前进程内分发
+#   UnixSocketFanout 通过本机 Unix 数据报套接字在多个工作进程间分发
+
+
+class BaseFanout:
+    def __init__(self, **options):
+        self._subscribers = {} # conversation_id -> {callback}
+        self._lock = threading.Lock()
+
+    def subscribe(self, conversation_id, callback):
+        with self._lock:
+            self._subscribers.setdefault(conversation_id, set()).add(callback)
+
+    def unsubscribe(self, conversation_id, callback):
+        with self._lock:
+            callbacks = self._subscribers.get(conversation_id)
+            if callbacks is None:
+                return
+            callbacks.discard(callback)
+            if not callbacks:
+                del self._subscribers[conversation_id]
+
+    def broadcast(self, conversation_id, payload):
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+    # 交给本进程内的订阅者
+    def _deliver(self, conversation_id, payload):
+        with self._lock:
+            callbacks = list(self._subscribers.get(conversation_id, ()))
+        for callback in callbacks:
+            try:
+                callback(payload)
+            except Exception:
+                logger.exception("Fanout subscriber failed for conversation %s", conversation_id)
+
+
+class InMemoryFanout(BaseFanout):
+    def broadcast(self, conversation_id, payload):
+        self._deliver(conversation_id, payload)
+
+
+class UnixSocketFanout(BaseFanout):
+    # 每个有订阅者的进程在 socket_dir 下绑定一个数据报套接字，
+    # 广播时向目录下所有套接字各发送一份（包括自己），由各进程的监听线程分发。
+    # 只广播不订阅的进程（如 uWSGI 工作进程）不会创建监听套接字。
+    SUFFIX = ".sock"
+
+    def __init__(self, socket_dir="/tmp/rtc-fanout", **options):
+        super().__init__(**options)
+        self.socket_dir = str(socket_dir)
+        os.makedirs(self.socket_dir, exist_ok=True)
+        self._sender = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        self._sender.setblocking(False)
+        self._listener = None
+        self._address = None
+
+    def subscribe(self, conversation_id, callback):
+        self._ensure_listener()
+        super().subscribe(conversation_id, callback)
+
+    def broadcast(self, conversation_id, payload):
+        data = dumps_json({"c": conversation_id, "p": payload})
+        for name in os.listdir(self.socket_dir):
+            if not name.endswith(self.SUFFIX):
+                continue
+            address = os.path.join(self.socket_dir, name)
+            try:
+                self._sender.sendto(data, address)
+            except (ConnectionRefusedError, FileNotFoundError): # 对端进程已退出，清理残留文件
+                self._remove(address)
+            except OSError as e: # 对端缓冲区已满或消息过大，尽力而为，客户端可通过历史接口补齐
+                logger.warning("Fanout to %s dropped: %s", address, e)
+
+    def close(self):
+        listener, self._listener = self._listener, None
+        if listener is not None:
+            listener.close()
+            self._remove(self._address)
+        self._sender.close()
+
+    def _ensure_listener(self):
+        with self._lock:
+            if self._listener is not None:
+                return
+            self._address = os.path.join(self.socket_dir, "%d-%s%s" % (os.getpid(), uuid.uuid4().hex[:8], self.SUFFIX))
+            listener = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+            listener.bind(self._address)
+            self._listener = listener
+        threading.Thread(target=self._listen, args=(listener,), name="fanout-listener", daemon=True).start()
+
+    def _listen(self, listener):
+        while True:
+            try:
+                data = listener.recv(1 << 20)
+            except OSError: # 套接字已关闭
+                return
+            try:
+                envelope = json.loads(data)
+            except ValueError:
+                continue
+            self._deliver(envelope["c"], envelope["p"])
+
+    @staticmethod
+    def _remove(address):
+        try:
+            os.unlink(address)
+        except OSError:
+            pass
+
+
+_fanout = None
+_fanout_pid = None
+_fanout_lock = threading.Lock()
+
+
+# 获取当前进程的广播后端；fork 之后会在子进程中重新创建
+def get_fanout():
+    global _fanout, _fanout_pid
+    with _fanout_lock:
+        if _fanout is None or _fanout_pid != os.getpid():
+            config = getattr(settings, "MESSAGE_FANOUT", {})
+            backend = import_string(config.get("BACKEND", "message.fanout.InMemoryFanout"))
+            _fanout = backend(**config.get("OPTIONS", {}))
+            _fanout_pid = os.getpid()
+        return _fanout
@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from message.export import EXPORT_CHUNK_SIZE, EXPORT_FORMATS, export_conversation
+from message.models import Conversation
+
+
+class Command(BaseCommand):
+    help = "流式导出会话的全部历史消息（NDJSON 或 CSV）"
+
+    def add_arguments(self, parser):
+        parser.add_argument("conversation_id", type=int)
+        parser.add_argument("--format", choices=sorted(EXPORT_FORMATS), default="ndjson")
+        parser.add_argument("--output", help="输出文件，缺省为标准输出")
+        parser.add_argument("--chunk-size", type=int, default=EXPORT_CHUNK_SIZE, help="每批读取的消息数")
+
+    def handle(self, *args, **options):
+        conversation_id = options["conversation_id"]
+        if not Conversation.objects.filter(id=conversation_id).exists():
+            raise CommandError(f"Conversation {conversation_id} does not exist")
+        chunks = export_conversation(conversation_id, options["format"], options["chunk_size"])
+        if options["output"]:
+            with open(options["output"], "wb") as output:
+                output.writelines(chunks)
+        else:
+            for chunk in chunks:
+                self.stdout.write(chunk.decode("utf-8"), ending="")
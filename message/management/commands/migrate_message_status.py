@@ -0,0 +1,41 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, Max, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+from message.models import Message, MessageStatus, Participant
+
+
+class Command(BaseCommand):
+    help = "将逐条消息的已读状态（MessageStatus）迁移为参与者的已读水位"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--delete", action="store_true", help="迁移后删除 MessageStatus 记录")
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            # 每个 (用户, 会话) 已读过的最大消息 id 作为水位
+            read_marks = MessageStatus.objects.filter(is_read=True).values(
+                "user_id", "message__conversation_id"
+            ).annotate(last_read=Max("message_id"), read_at=Max("read_at"))
+
+            migrated = 0
+            for mark in read_marks.iterator():
+                migrated += Participant.objects.filter(
+                    user_id=mark["user_id"],
+                    conversation_id=mark["message__conversation_id"],
+                    last_read_message_id__lt=mark["last_read"]
+                ).update(last_read_message_id=mark["last_read"], read_at=mark["read_at"])
+
+            # 按新水位统一重算最新消息与未读数
+            latest = Message.objects.filter(conversation_id=OuterRef("conversation_id")).order_by("-id").values("id")[:1]
+            unread = Message.objects.filter(
+                conversation_id=OuterRef("conversation_id"), id__gt=OuterRef("last_read_message_id")
+            ).exclude(sender_id=OuterRef("user_id")).values("conversation_id").annotate(count=Count("id")).values("count")
+            Participant.objects.update(
+                last_message_id=Subquery(latest),
+                unread_count=Coalesce(Subquery(unread), Value(0))
+            )
+
+            deleted = MessageStatus.objects.all().delete()[0] if options["delete"] else 0
+        self.stdout.write(f"Migrated {migrated} read watermarks, deleted {deleted} MessageStatus rows")
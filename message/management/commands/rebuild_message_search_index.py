@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from message.search import get_search_backend
+
+
+class Command(BaseCommand):
+    help = "重建消息全文索引（已有消息导入或切换搜索后端后执行）"
+
+    def handle(self, *args, **options):
+        get_search_backend().rebuild()
+        self.stdout.write("Message search index rebuilt")
@@ -1,3 +1,4 @@
+from django.core.serializers.json import DjangoJSONEncoder
 from django.db import models
 from user.models import User
 
@@ -17,9 +18,26 @@ class Participant(models.Model):
     conversation = models.ForeignKey(Conversation, on_delete=models.CASCADE)
     joined_at = models.DateTimeField(auto_now_add=True) # 进群时间
     is_admin = models.BooleanField(default=False) # 是否为群管理员
+    # 以下为冗余状态，发送/已读时增量更新，聊天列表无需扫描消息表
+    last_message = models.ForeignKey('Message', null=True, blank=True, related_name='+', on_delete=models.SET_NULL) # 会话最新消息
+    last_read_message_id = models.BigIntegerField(default=0) # 已读到的消息id（已读水位，id 不大于它的消息均视为已读）
+    read_at = models.DateTimeField(null=True, blank=True) # 最近一次已读时间
+    unread_count = models.IntegerField(default=0) # 未读消息数
     
     class Meta:
         unique_together = ('user', 'conversation')
+        indexes = [models.Index(fields=["user", "last_message"])] # 聊天列表按最新消息排序
+
+    def serialize(self): # 聊天列表项，需 select_related('conversation', 'last_message')
+        return {
+            "conversationId": self.conversation_id,
+            "title": self.conversation.title,
+            "isGroup": self.conversation.is_group,
+            "lastMessage": self.last_message.serialize() if self.last_message else None,
+            "lastReadMessageId": self.last_read_message_id,
+            "readAt": self.read_at,
+            "unreadCount": self.unread_count
+        }
 
 # 信息表
 class Message(models.Model):
@@ -29,7 +47,21 @@ class Message(models.Model):
     quote = models.ForeignKey('self', null=True, blank=True, on_delete=models.CASCADE) # 引用消息
     sent_at = models.DateTimeField(auto_now_add=True) # 发送时间
 
-# 消息状态表
+    class Meta: # 按 (sent_at, id) 分页查询历史消息
+        indexes = [models.Index(fields=["conversation", "sent_at", "id"])]
+
+    def serialize(self): # 序列化
+        return {
+            "id": self.id,
+            "conversationId": self.conversation_id,
+            "sender": self.sender_id,
+            "text": self.text,
+            "quote": self.quote_id,
+            "sentAt": self.sent_at
+        }
+
+# 消息状态表（已废弃）：已读状态改由 Participant 的已读水位表示，
+# 旧数据可通过 `python manage.py migrate_message_status` 迁移
 class MessageStatus(models.Model):
     message = models.ForeignKey(Message, on_delete=models.CASCADE, related_name='statuses')
     user = models.ForeignKey(User, on_delete=models.CASCADE)
@@ -45,4 +77,34 @@ class Announcement(models.Model):
     message = models.TextField()
     announced_at = models.DateTimeField(auto_now_add=True)
     class Meta:
-        indexes = [models.Index(fields=["conversation"])]
\ No newline at end of file
+        indexes = [models.Index(fields=["conversation"])]
+
+    def serialize(self):
+        return {
+            "id": self.id,
+            "conversationId": self.conversation_id,
+            "message": self.message,
+            "announcedAt": self.announced_at
+        }
+
+# 事件日志：消息、公告、好友关系、好友申请的每次变更追加一条事件，seq 全局单调递增，
+# 与变更在同一事务中写入（见 message.events），客户端按 seq 增量同步
+class Event(models.Model):
+    seq = models.BigAutoField(primary_key=True) # 全局序号（SQLite 下为 AUTOINCREMENT，不会复用）
+    kind = models.CharField(max_length=32) # 事件类型，如 message.created
+    user = models.ForeignKey(User, null=True, blank=True, db_constraint=False, on_delete=models.DO_NOTHING, related_name='+') # 面向单个用户的事件
+    conversation_id = models.BigIntegerField(null=True, blank=True) # 面向会话全体参与者的事件
+    payload = models.JSONField(encoder=DjangoJSONEncoder)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta: # 按接收者做 seq 范围扫描
+        indexes = [models.Index(fields=["user", "seq"]), models.Index(fields=["conversation_id", "seq"])]
+
+    def serialize(self):
+        return {
+            "seq": self.seq,
+            "kind": self.kind,
+            "conversationId": self.conversation_id,
+            "payload": self.payload,
+            "createdAt": self.created_at
+        }
@@ -0,0 +1,174 @@
+import threading
+
+from django.conf import settings
+from django.db import connections, router
+from django.utils.module_loading import import_string
+
+from message.models import Message
+
+# 消息全文搜索：发送时增量建立索引，搜索范围限定在用户参与的会话内
+# 后端通过 settings.MESSAGE_SEARCH 配置：
+#   SqliteFtsBackend  SQLite FTS5 虚表（trigram 分词，支持中文等任意语言的子串匹配）
+#   LikeBackend       不建索引，在会话范围内 LIKE 查询，用于其他数据库
+# 新后端实现 install / index / remove / search 即可
+
+SNIPPET_START, SNIPPET_END = "<mark>", "</mark>" # 摘要中命中部分的标记
+SNIPPET_TOKENS = 32 # 摘要长度：FTS5 的词项数（trigram 分词下约为字符数），LIKE 时为字符数
+
+
+# 截取第一个命中词附近的文本并标记所有命中词
+def make_snippet(text, terms, width=SNIPPET_TOKENS):
+    lowered = text.lower()
+    first = min((i for i in (lowered.find(term.lower()) for term in terms) if i >= 0), default=0)
+    start = max(0, first - width // 2)
+    end = min(len(text), start + width)
+    snippet = text[start:end]
+    for term in sorted(set(terms), key=len, reverse=True):
+        lowered, parts, i = snippet.lower(), [], 0
+        while True:
+            j = lowered.find(term.lower(), i)
+            if j < 0:
+                break
+            parts += [snippet[i:j], SNIPPET_START, snippet[j:j + len(term)], SNIPPET_END]
+            i = j + len(term)
+        snippet = "".join(parts) + snippet[i:]
+    return ("…" if start > 0 else "") + snippet + ("…" if end < len(text) else "")
+
+
+class BaseSearchBackend:
+    def __init__(self, **options):
+        pass
+
+    # 建立索引所需的表（post_migrate 时调用）
+    def install(self, using):
+        pass
+
+    def index(self, message: Message):
+        pass
+
+    def remove(self, message_id):
+        pass
+
+    def rebuild(self):
+        pass
+
+    # 返回 ([(消息id, 摘要)], 总数)，按相关度排序
+    def search(self, conversation_ids, terms, offset, limit):
+        raise NotImplementedError
+
+
+class LikeBackend(BaseSearchBackend):
+    def search(self, conversation_ids, terms, offset, limit):
+        messages = Message.objects.filter(conversation_id__in=conversation_ids)
+        for term in terms:
+            messages = messages.filter(text__icontains=term)
+        total = messages.count()
+        page = messages.order_by("-id").values_list("id", "text")[offset:offset + limit]
+        return [(message_id, make_snippet(text, terms)) for message_id, text in page], total
+
+
+class SqliteFtsBackend(LikeBackend):
+    # 会话也是索引列：每行的 conversation 列只含一个词 "<会话id>"，
+    # MATCH 同时按会话过滤，只需合并所涉会话的倒排列表，而不是匹配全部会话后再过滤
+    TABLE = "message_search"
+    COLUMNS = ("text", "conversation")
+
+    def __init__(self, tokenize="trigram", **options):
+        super().__init__(**options)
+        self.tokenize = tokenize
+        # trigram 分词下短于 3 个字符的词无法走索引
+        self.min_term_length = 3 if tokenize.startswith("trigram") else 1
+
+    # 会话词项：两侧的定界符使 trigram 短语只能完整匹配，"<12>" 不会命中 "<123>"
+    @staticmethod
+    def conversation_token(conversation_id):
+        return f"<{conversation_id}>"
+
+    def _cursor(self, read=False):
+        using = router.db_for_read(Message) if read else router.db_for_write(Message)
+        return connections[using].cursor()
+
+    def install(self, using):
+        connection = connections[using]
+        if connection.vendor != "sqlite":
+            return
+        with connection.cursor() as cursor:
+            cursor.execute(f"PRAGMA table_info({self.TABLE})")
+            columns = tuple(row[1] for row in cursor.fetchall())
+            if columns == self.COLUMNS:
+                return
+            # 旧版索引（会话列不建索引）需删除后按新结构重建
+            cursor.execute(f"DROP TABLE IF EXISTS {self.TABLE}")
+            cursor.execute(
+                f"CREATE VIRTUAL TABLE {self.TABLE} USING fts5(text, conversation, tokenize='{self.tokenize}')"
+            )
+            if columns:
+                self._fill(cursor)
+
+    def _fill(self, cursor):
+        cursor.execute(
+            f"INSERT INTO {self.TABLE} (rowid, text, conversation) "
+            f"SELECT id, text, '<' || conversation_id || '>' FROM {Message._meta.db_table}"
+        )
+
+    def index(self, message: Message):
+        with self._cursor() as cursor:
+            cursor.execute(
+                f"INSERT OR REPLACE INTO {self.TABLE} (rowid, text, conversation) VALUES (%s, %s, %s)",
+                [message.id, message.text, self.conversation_token(message.conversation_id)]
+            )
+
+    def remove(self, message_id):
+        with self._cursor() as cursor:
+            cursor.execute(f"DELETE FROM {self.TABLE} WHERE rowid = %s", [message_id])
+
+    def rebuild(self):
+        with self._cursor() as cursor:
+            cursor.execute(f"DELETE FROM {self.TABLE}")
+            self._fill(cursor)
+
+    def search(self, conversation_ids, terms, offset, limit):
+        if any(len(term) < self.min_term_length for term in terms):
+            return super().search(conversation_ids, terms, offset, limit)
+        # 每个词作为一个短语（转义双引号），多个词之间为 AND，只在 text 列中匹配；
+        # 会话范围同样写在 MATCH 中，由索引完成过滤
+        text = " ".join('"%s"' % term.replace('"', '""') for term in terms)
+        conversations = " OR ".join('"%s"' % self.conversation_token(int(i)) for i in conversation_ids)
+        query = f"text : ({text}) AND conversation : ({conversations})"
+        where = f"{self.TABLE} MATCH %s"
+        with self._cursor(read=True) as cursor:
+            cursor.execute(f"SELECT COUNT(*) FROM {self.TABLE} WHERE {where}", [query])
+            total = cursor.fetchone()[0]
+            cursor.execute(
+                f"SELECT rowid, snippet({self.TABLE}, 0, %s, %s, '…', %s) FROM {self.TABLE} "
+                f"WHERE {where} ORDER BY rank LIMIT %s OFFSET %s",
+                [SNIPPET_START, SNIPPET_END, SNIPPET_TOKENS, query, limit, offset]
+            )
+            return cursor.fetchall(), total
+
+
+_backend = None
+_backend_lock = threading.Lock()
+
+
+def get_search_backend():
+    global _backend
+    with _backend_lock:
+        if _backend is None:
+            config = getattr(settings, "MESSAGE_SEARCH", {})
+            backend = import_string(config.get("BACKEND", "message.search.LikeBackend"))
+            _backend = backend(**config.get("OPTIONS", {}))
+        return _backend
+
+
+# 在 conversation_ids 范围内搜索，返回 ([{"message": ..., "snippet": ...}], 总数)
+def search_messages(conversation_ids, keyword, offset=0, limit=20):
+    terms = keyword.split()
+    if not terms or not conversation_ids:
+        return [], 0
+    hits, total = get_search_backend().search(list(conversation_ids), terms, offset, limit)
+    messages = Message.objects.in_bulk([message_id for message_id, _ in hits])
+    return [
+        {"message": messages[message_id].serialize(), "snippet": snippet}
+        for message_id, snippet in hits if message_id in messages
+    ], total
@@ -0,0 +1,163 @@
+import operator
+from datetime import timedelta
+from functools import reduce
+
+from django.db import transaction
+from django.db.models import BigIntegerField, Case, F, IntegerField, Q, Value, When
+from django.db.models.functions import Coalesce, Greatest
+from django.utils import timezone
+
+from message.models import Announcement, Conversation, Message, Participant
+from utils.utils_cursor import encode_cursor
+
+# read_at 在已读 UPDATE 提交之前生成，提交较晚的已读可能带着更早的时间出现。
+# 同步已读水位时重读此窗口内的变化，水位是幂等的状态，重复返回无害
+READ_SYNC_OVERLAP = timedelta(seconds=5)
+SYNC_MARK_CHUNK = 300 # 每次查询包含的客户端会话水位数
+
+
+# 发送消息：消息本身与所有参与者的冗余状态在同一事务内写入，
+# 查询数与群成员数无关；事务提交后由广播层推送
+def send_message(conversation_id, sender_name, text, quote_id=None):
+    with transaction.atomic():
+        message = Message.objects.create(
+            conversation_id=conversation_id, sender_id=sender_name, text=text, quote_id=quote_id
+        ) # post_save 中调用 record_message_sent 并登记推送
+        Conversation.objects.filter(id=conversation_id).update(updated_at=message.sent_at)
+    return message
+
+
+# 新消息写入后更新会话内所有参与者的冗余状态（一条 UPDATE）：
+# 发送者视为已读，其余参与者未读数 +1
+# 并发发送可能乱序提交，最新消息与已读水位取较大值，只前进不后退
+def record_message_sent(message: Message):
+    Participant.objects.filter(conversation_id=message.conversation_id).update(
+        last_message_id=Greatest(Coalesce(F("last_message_id"), Value(0)), Value(message.id), output_field=BigIntegerField()),
+        last_read_message_id=Case(
+            When(user_id=message.sender_id, then=Greatest(F("last_read_message_id"), Value(message.id))),
+            default=F("last_read_message_id"),
+            output_field=BigIntegerField()
+        ),
+        unread_count=Case(
+            When(user_id=message.sender_id, then=Value(0)),
+            default=F("unread_count") + 1,
+            output_field=IntegerField()
+        )
+    )
+
+
+# 标记已读到 message_id（缺省为会话最新消息），已读位置只前进不后退
+# 返回更新后的未读数
+# 未读数由 participant 的快照算出，UPDATE 以最新消息未变为条件：其间有新消息提交时
+# （record_message_sent 会使未读数 +1），不覆盖其计数，重新加载后再试
+MARK_READ_RETRIES = 5
+
+
+def mark_read(participant: Participant, message_id=None):
+    requested = message_id
+    for _ in range(MARK_READ_RETRIES):
+        last_message_id = participant.last_message_id
+        if requested is None or requested >= (last_message_id or 0):
+            message_id = last_message_id or 0
+            unread_count = 0
+        else:
+            message_id = requested
+            unread_count = Message.objects.filter(
+                conversation_id=participant.conversation_id, id__gt=message_id
+            ).exclude(sender_id=participant.user_id).count()
+        if message_id <= participant.last_read_message_id:
+            return participant.unread_count
+        read_at = timezone.now()
+        updated = Participant.objects.filter(
+            pk=participant.pk, last_read_message_id__lt=message_id, last_message_id=last_message_id
+        ).update(last_read_message_id=message_id, read_at=read_at, unread_count=unread_count)
+        if updated:
+            participant.last_read_message_id = message_id
+            participant.read_at = read_at
+            participant.unread_count = unread_count
+            return unread_count
+        participant.refresh_from_db(fields=["last_message", "last_read_message_id", "read_at", "unread_count"])
+    return participant.unread_count
+
+
+# 已读回执：由已读水位推导，不需要逐条消息的状态记录
+def get_read_receipts(message: Message):
+    return Participant.objects.filter(
+        conversation_id=message.conversation_id, last_read_message_id__gte=message.id
+    ).exclude(user_id=message.sender_id).order_by("read_at").values_list("user_id", "read_at")
+
+
+# 离线同步：返回客户端水位之后的新消息、已读水位变化与群公告，
+# 查询数与会话数无关（客户端给出水位的会话每 SYNC_MARK_CHUNK 个多一次查询）
+#   message_marks    {会话id: 客户端已有的最大消息id}，缺省的会话从该用户的已读水位开始
+#   announcement_id  客户端已有的最大公告id
+#   read_after       上次同步返回的 readCursor 解码后的 (read_at, 参与者id)，之后变化的已读水位会被返回
+# 每类最多返回 limit 条，hasMore 为真时客户端以新的水位继续同步
+def sync_changes(user_name, message_marks, announcement_id=0, read_after=None, limit=200):
+    synced_at = timezone.now()
+    participants = list(Participant.objects.filter(user_id=user_name).values_list(
+        "conversation_id", "last_message_id", "last_read_message_id"
+    ))
+    conversation_ids = [conversation_id for conversation_id, _, _ in participants]
+    marks, pending, unmarked = {}, [], False
+    for conversation_id, last_message_id, last_read_message_id in participants:
+        marks[conversation_id] = message_marks.get(conversation_id, last_read_message_id)
+        if (last_message_id or 0) <= marks[conversation_id]: # 没有新消息的会话
+            continue
+        if conversation_id in message_marks:
+            pending.append(Q(conversation_id=conversation_id, id__gt=marks[conversation_id]))
+        else:
+            unmarked = True
+
+    # 按 id 全局有序截断：每个会话中不大于最后一条的新消息都已返回，水位可直接前移
+    # 客户端未给出水位的会话与参与者表连接，从已读水位开始，查询大小与会话数无关；
+    # 客户端给出的水位按 SYNC_MARK_CHUNK 个一批查询（过长的 OR 条件会超出 SQLite 的表达式深度限制）
+    queries = []
+    if unmarked:
+        queries.append(Message.objects.filter(
+            conversation__participant__user_id=user_name,
+            id__gt=F("conversation__participant__last_read_message_id")
+        ).exclude(conversation_id__in=list(message_marks)))
+    for i in range(0, len(pending), SYNC_MARK_CHUNK):
+        queries.append(Message.objects.filter(reduce(operator.or_, pending[i:i + SYNC_MARK_CHUNK])))
+    messages = sorted(
+        (message for query in queries for message in query.order_by("id")[:limit + 1]), key=lambda message: message.id
+    )[:limit + 1]
+    has_more = len(messages) > limit
+    messages = messages[:limit]
+    for message in messages:
+        marks[message.conversation_id] = message.id
+
+    announcements = list(Announcement.objects.filter(
+        conversation_id__in=conversation_ids, id__gt=announcement_id
+    ).order_by("id")[:limit + 1])
+    has_more = has_more or len(announcements) > limit
+    announcements = announcements[:limit]
+
+    # 已读水位按 (read_at, id) 键集分页，时间相同的记录不会在分页边界被跳过
+    watermarks, read_cursor = [], None
+    if read_after is not None:
+        read_at, participant_id = read_after
+        watermarks = list(Participant.objects.filter(
+            Q(read_at__gt=read_at) | Q(read_at=read_at, id__gt=participant_id), conversation_id__in=conversation_ids
+        ).order_by("read_at", "id").values_list(
+            "conversation_id", "user_id", "last_read_message_id", "read_at", "id"
+        )[:limit + 1])
+        has_more = has_more or len(watermarks) > limit
+        if len(watermarks) > limit: # 未取完时下次从最后一条之后继续
+            watermarks = watermarks[:limit]
+            read_cursor = watermarks[-1][3], watermarks[-1][4]
+    if read_cursor is None: # 已取完时下次从本次同步开始前的重叠窗口起重读
+        read_cursor = synced_at - READ_SYNC_OVERLAP, 0
+
+    return {
+        "messages": [message.serialize() for message in messages],
+        "readWatermarks": [{
+            "conversationId": conversation_id, "userName": user_id, "lastReadMessageId": last_read, "readAt": read_at
+        } for conversation_id, user_id, last_read, read_at, _ in watermarks],
+        "announcements": [announcement.serialize() for announcement in announcements],
+        "marks": {str(conversation_id): mark for conversation_id, mark in marks.items()},
+        "announcementId": announcements[-1].id if announcements else announcement_id,
+        "readCursor": encode_cursor(*read_cursor),
+        "hasMore": has_more
+    }
@@ -0,0 +1,81 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from friend.models import FriendRequest, Friendship, friend_request_status_changed, friendships_created
+from message.events import record_event, record_events
+from message.fanout import get_fanout
+from message.models import Announcement, Message
+from message.search import get_search_backend
+from message.services import record_message_sent
+
+
+# 新消息写入后更新参与者的最新消息与未读数
+@receiver(post_save, sender=Message)
+def update_participants(sender, instance, created, **kwargs):
+    if created:
+        record_message_sent(instance)
+
+
+# 新消息提交后推送给该会话的在线订阅者
+@receiver(post_save, sender=Message)
+def broadcast_new_message(sender, instance, created, **kwargs):
+    if not created:
+        return
+    payload = {"type": "message", "message": instance.serialize()}
+    conversation_id = instance.conversation_id
+    transaction.on_commit(lambda: get_fanout().broadcast(conversation_id, payload))
+
+
+# 消息写入或删除时增量更新全文索引（与消息在同一事务中）
+@receiver(post_save, sender=Message)
+def index_message(sender, instance, raw=False, **kwargs):
+    if not raw:
+        get_search_backend().index(instance)
+
+
+@receiver(post_delete, sender=Message)
+def unindex_message(sender, instance, **kwargs):
+    get_search_backend().remove(instance.id)
+
+
+# 事件日志：变更在事务中进行，事件随之写入
+@receiver(post_save, sender=Message)
+def log_message_event(sender, instance, created, raw=False, **kwargs):
+    if not raw:
+        record_event("message.created" if created else "message.updated", instance.serialize(), conversation_id=instance.conversation_id)
+
+
+@receiver(post_save, sender=Announcement)
+def log_announcement_event(sender, instance, created, raw=False, **kwargs):
+    if not raw:
+        record_event("announcement.created" if created else "announcement.updated", instance.serialize(), conversation_id=instance.conversation_id)
+
+
+def _friendship_event(kind, friendship):
+    return kind, {"toUser": friendship.to_user_id, "remark": friendship.remark, "tag": friendship.tag}, friendship.from_user_id, None
+
+
+@receiver(post_save, sender=Friendship)
+def log_friendship_event(sender, instance, created, raw=False, **kwargs):
+    if not raw:
+        record_events([_friendship_event("friendship.created" if created else "friendship.updated", instance)])
+
+
+@receiver(friendships_created, sender=Friendship)
+def log_friendships_created(sender, friendships, **kwargs):
+    record_events([_friendship_event("friendship.created", friendship) for friendship in friendships])
+
+
+@receiver(post_delete, sender=Friendship)
+def log_friendship_deleted(sender, instance, **kwargs):
+    record_events([_friendship_event("friendship.deleted", instance)])
+
+
+# 好友申请的事件同时发给申请双方
+@receiver(post_save, sender=FriendRequest)
+@receiver(friend_request_status_changed, sender=FriendRequest)
+def log_friend_request_event(sender, instance, raw=False, **kwargs):
+    if not raw:
+        payload = instance.event_payload()
+        record_events([("friendRequest.updated", payload, user_name, None) for user_name in (instance.from_user_id, instance.to_user_id)])
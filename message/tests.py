@@ -1,3 +1,640 @@
+import csv
+import io
+import json
+import os
+import socket
+import tempfile
+import threading
+from datetime import timedelta
+from unittest import mock, skipUnless
+
+from asgiref.sync import async_to_sync, sync_to_async
+from asgiref.testing import ApplicationCommunicator
+from django.core.management import call_command
+from django.db import connection, transaction
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from DjangoHW.asgi import application
+from message.fanout import InMemoryFanout, UnixSocketFanout
+from friend.models import FriendRequest, Friendship
+from message.events import iter_events
+from message.export import export_conversation
+from message.search import LikeBackend, SqliteFtsBackend, get_search_backend, make_snippet
+from message.models import Announcement, Conversation, Event, Message, MessageStatus, Participant
+from message.services import mark_read, record_message_sent, send_message
+from user.models import User
+from utils.utils_jwt import generate_jwt_token
+
 
 # Create your tests here.
+class WebSocketTests(TestCase):
+    # Initializer
+    def setUp(self):
+        self.alice = User.objects.create(name="Alice", password="123456")
+        self.bob = User.objects.create(name="Bob", password="123456")
+        self.conversation = Conversation.objects.create()
+        Participant.objects.create(user=self.alice, conversation=self.conversation)
+        Participant.objects.create(user=self.bob, conversation=self.conversation)
+
+    def _scope(self, query_string=b"", path="/ws/message"):
+        return {"type": "websocket", "path": path, "query_string": query_string}
+
+    def _send_message(self, text):
+        with self.captureOnCommitCallbacks(execute=True):
+            Message.objects.create(conversation=self.conversation, sender=self.alice, text=text)
+
+    # ! Test section
+    def test_connect_without_token(self):
+        async def scenario():
+            communicator = ApplicationCommunicator(application, self._scope())
+            await communicator.send_input({"type": "websocket.connect"})
+            return await communicator.receive_output(1)
+
+        output = async_to_sync(scenario)()
+        self.assertEqual(output, {"type": "websocket.close", "code": 4401})
+
+    def test_connect_to_unknown_path(self):
+        async def scenario():
+            query = ("token=" + generate_jwt_token("Bob")).encode("utf-8")
+            communicator = ApplicationCommunicator(application, self._scope(query, "/ws/unknown"))
+            await communicator.send_input({"type": "websocket.connect"})
+            return await communicator.receive_output(1)
+
+        output = async_to_sync(scenario)()
+        self.assertEqual(output, {"type": "websocket.close", "code": 4404})
+
+    def test_receive_new_message(self):
+        async def scenario():
+            query = ("token=" + generate_jwt_token("Bob")).encode("utf-8")
+            communicator = ApplicationCommunicator(application, self._scope(query))
+            await communicator.send_input({"type": "websocket.connect"})
+            outputs = [await communicator.receive_output(1), await communicator.receive_output(1)]
+            await sync_to_async(self._send_message)("Hello")
+            outputs.append(await communicator.receive_output(1))
+            await communicator.send_input({"type": "websocket.disconnect", "code": 1000})
+            await communicator.wait(1)
+            return outputs
+
+        accept, subscribed, pushed = async_to_sync(scenario)()
+        self.assertEqual(accept, {"type": "websocket.accept"})
+        self.assertEqual(json.loads(subscribed["text"]), {"type": "subscribed", "conversations": [self.conversation.id]})
+        payload = json.loads(pushed["text"])
+        self.assertEqual(payload["type"], "message")
+        self.assertEqual(payload["message"]["text"], "Hello")
+        self.assertEqual(payload["message"]["sender"], "Alice")
+        self.assertEqual(payload["message"]["conversationId"], self.conversation.id)
+
+
+class FanoutTests(TestCase):
+    # ! Test section
+    def test_in_memory_fanout(self):
+        fanout = InMemoryFanout()
+        received = []
+        fanout.subscribe(1, received.append)
+        fanout.broadcast(1, {"text": "Hello"})
+        fanout.broadcast(2, {"text": "Other"})
+        fanout.unsubscribe(1, received.append)
+        fanout.broadcast(1, {"text": "Ignored"})
+        self.assertEqual(received, [{"text": "Hello"}])
+
+    @skipUnless(hasattr(socket, "AF_UNIX"), "Unix sockets not available")
+    def test_unix_socket_fanout_across_instances(self):
+        # 两个实例模拟同一主机上的两个工作进程
+        with tempfile.TemporaryDirectory() as socket_dir:
+            subscriber = UnixSocketFanout(socket_dir=socket_dir)
+            publisher = UnixSocketFanout(socket_dir=socket_dir)
+            received = []
+            delivered = threading.Event()
+
+            def callback(payload):
+                received.append(payload)
+                delivered.set()
+
+            subscriber.subscribe(7, callback)
+            publisher.broadcast(7, {"text": "Hello"})
+            self.assertTrue(delivered.wait(1))
+            self.assertEqual(received, [{"text": "Hello"}])
+            # 只广播的实例不创建监听套接字
+            self.assertEqual(len(os.listdir(socket_dir)), 1)
+            subscriber.close()
+            publisher.close()
+            self.assertEqual(os.listdir(socket_dir), [])
+
+
+class HistoryTests(TestCase):
+    # Initializer
+    def setUp(self):
+        self.alice = User.objects.create(name="Alice", password="123456")
+        self.bob = User.objects.create(name="Bob", password="123456")
+        self.conversation = Conversation.objects.create()
+        Participant.objects.create(user=self.alice, conversation=self.conversation)
+        self.messages = [
+            Message.objects.create(conversation=self.conversation, sender=self.alice, text=str(i)) for i in range(5)
+        ]
+        # 相同发送时间时按 id 排序
+        Message.objects.filter(id__in=[m.id for m in self.messages[1:4]]).update(sent_at=self.messages[1].sent_at)
+
+    def _get(self, **params):
+        return self.client.get(f"/message/{self.conversation.id}", data={"userName": "Alice", **params})
+
+    # ! Test section
+    def test_history_pages(self):
+        texts = []
+        cursor = None
+        while True:
+            res = self._get(limit=2, **({"cursor": cursor} if cursor else {}))
+            self.assertEqual(res.status_code, 200)
+            texts += [message["text"] for message in res.json()["messages"]]
+            cursor = res.json()["nextCursor"]
+            if cursor is None:
+                break
+        self.assertEqual(texts, ["4", "3", "2", "1", "0"])
+
+    def test_history_not_participant(self):
+        res = self.client.get(f"/message/{self.conversation.id}", data={"userName": "Bob"})
+        self.assertEqual(res.status_code, 403)
+        self.assertEqual(res.json()['code'], 1)
+
+    def test_history_bad_cursor(self):
+        res = self._get(cursor="not-a-cursor")
+        self.assertEqual(res.status_code, 400)
+        self.assertEqual(res.json()['code'], -1)
+        self.assertEqual(res.json()['info'], 'Bad param [cursor]')
+
+    def test_history_with_bad_method(self):
+        res = self.client.post(f"/message/{self.conversation.id}", data={"userName": "Alice"}, content_type='application/json')
+        self.assertEqual(res.status_code, 405)
+        self.assertEqual(res.json()['code'], -3)
+
+
+class ConversationListTests(TestCase):
+    # Initializer
+    def setUp(self):
+        self.alice = User.objects.create(name="Alice", password="123456")
+        self.bob = User.objects.create(name="Bob", password="123456")
+        self.conversations = [Conversation.objects.create(title=f"Chat {i}", is_group=True) for i in range(3)]
+        for conversation in self.conversations:
+            Participant.objects.create(user=self.alice, conversation=conversation)
+            Participant.objects.create(user=self.bob, conversation=conversation)
+
+    def _send(self, conversation, sender, text):
+        return Message.objects.create(conversation=conversation, sender=sender, text=text)
+
+    # ! Test section
+    def test_list_counters(self):
+        self._send(self.conversations[0], self.alice, "a")
+        self._send(self.conversations[1], self.alice, "b")
+        last = self._send(self.conversations[1], self.alice, "c")
+        self._send(self.conversations[0], self.bob, "d")
+
+        with self.assertNumQueries(1):
+            res = self.client.get("/message/", data={"userName": "Bob"})
+        self.assertEqual(res.status_code, 200)
+        conversations = res.json()["conversations"]
+        self.assertEqual([c["conversationId"] for c in conversations], [c.id for c in self.conversations[:2]] + [self.conversations[2].id])
+        self.assertEqual(conversations[0]["lastMessage"]["text"], "d")
+        self.assertEqual(conversations[0]["unreadCount"], 0) # 发送消息视为已读此前的消息
+        self.assertEqual(conversations[1]["lastMessage"]["id"], last.id)
+        self.assertEqual(conversations[1]["unreadCount"], 2)
+        self.assertIsNone(conversations[2]["lastMessage"])
+
+    def test_read_conversation(self):
+        first = self._send(self.conversations[0], self.alice, "a")
+        last = self._send(self.conversations[0], self.alice, "b")
+        url = f"/message/{self.conversations[0].id}/read"
+
+        res = self.client.post(url, data={"userName": "Bob", "messageId": first.id}, content_type='application/json')
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(res.json()["unreadCount"], 1)
+
+        res = self.client.post(url, data={"userName": "Bob"}, content_type='application/json')
+        self.assertEqual(res.json()["lastReadMessageId"], last.id)
+        self.assertEqual(res.json()["unreadCount"], 0)
+
+        # 已读位置不后退
+        res = self.client.post(url, data={"userName": "Bob", "messageId": first.id}, content_type='application/json')
+        self.assertEqual(res.json()["lastReadMessageId"], last.id)
+        self.assertEqual(Participant.objects.get(user=self.bob, conversation=self.conversations[0]).unread_count, 0)
+
+    def test_read_not_participant(self):
+        conversation = Conversation.objects.create()
+        res = self.client.post(f"/message/{conversation.id}/read", data={"userName": "Bob"}, content_type='application/json')
+        self.assertEqual(res.status_code, 403)
+
+
+class ReadWatermarkTests(TestCase):
+    # Initializer
+    def setUp(self):
+        self.alice = User.objects.create(name="Alice", password="123456")
+        self.bob = User.objects.create(name="Bob", password="123456")
+        self.carol = User.objects.create(name="Carol", password="123456")
+        self.conversation = Conversation.objects.create(is_group=True)
+        for user in (self.alice, self.bob, self.carol):
+            Participant.objects.create(user=user, conversation=self.conversation)
+        self.messages = [
+            Message.objects.create(conversation=self.conversation, sender=self.alice, text=str(i)) for i in range(3)
+        ]
+
+    # ! Test section
+    def test_read_receipts(self):
+        url = f"/message/{self.conversation.id}/read"
+        self.client.post(url, data={"userName": "Bob", "messageId": self.messages[1].id}, content_type='application/json')
+
+        res = self.client.get(f"/message/{self.conversation.id}/receipts", data={"userName": "Alice", "messageId": self.messages[0].id})
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual([reader["userName"] for reader in res.json()["readers"]], ["Bob"])
+        res = self.client.get(f"/message/{self.conversation.id}/receipts", data={"userName": "Alice", "messageId": self.messages[2].id})
+        self.assertEqual(res.json()["readers"], [])
+
+    def test_read_with_interleaved_send(self):
+        participant = Participant.objects.get(user=self.bob, conversation=self.conversation)
+        newer = send_message(self.conversation.id, "Alice", "Later") # 加载之后、标记已读之前有新消息提交
+        self.assertEqual(mark_read(participant), 0)
+        participant = Participant.objects.get(user=self.bob, conversation=self.conversation)
+        self.assertEqual((participant.last_read_message_id, participant.unread_count), (newer.id, 0))
+
+        participant = Participant.objects.get(user=self.carol, conversation=self.conversation)
+        newer = send_message(self.conversation.id, "Alice", "Even later")
+        self.assertEqual(mark_read(participant, self.messages[2].id), 2) # 部分已读：新消息计入未读数
+        self.assertEqual(Participant.objects.get(pk=participant.pk).unread_count, 2)
+
+    def test_receipts_message_not_found(self):
+        other = Conversation.objects.create()
+        message = Message.objects.create(conversation=other, sender=self.alice, text="x")
+        res = self.client.get(f"/message/{self.conversation.id}/receipts", data={"userName": "Alice", "messageId": message.id})
+        self.assertEqual(res.status_code, 404)
+
+    def test_migrate_message_status(self):
+        Participant.objects.update(last_read_message_id=0, unread_count=0, last_message=None)
+        MessageStatus.objects.create(message=self.messages[0], user=self.bob, is_read=True, read_at=timezone.now())
+        MessageStatus.objects.create(message=self.messages[1], user=self.bob, is_read=True, read_at=timezone.now())
+        MessageStatus.objects.create(message=self.messages[2], user=self.bob, is_read=False)
+        MessageStatus.objects.create(message=self.messages[0], user=self.carol, is_read=False)
+
+        call_command("migrate_message_status", "--delete", stdout=io.StringIO())
+
+        bob = Participant.objects.get(user=self.bob)
+        self.assertEqual(bob.last_read_message_id, self.messages[1].id)
+        self.assertEqual(bob.unread_count, 1)
+        self.assertEqual(bob.last_message_id, self.messages[2].id)
+        self.assertEqual(Participant.objects.get(user=self.carol).unread_count, 3)
+        self.assertEqual(Participant.objects.get(user=self.alice).unread_count, 0)
+        self.assertFalse(MessageStatus.objects.exists())
+
+
+class SendMessageTests(TestCase):
+    # Initializer
+    def setUp(self):
+        self.alice = User.objects.create(name="Alice", password="123456")
+        self.conversation = Conversation.objects.create(is_group=True)
+        Participant.objects.create(user=self.alice, conversation=self.conversation)
+
+    def _add_members(self, count):
+        start = User.objects.count()
+        users = User.objects.bulk_create([User(name=f"Member{start + i}", password="123456") for i in range(count)])
+        Participant.objects.bulk_create([Participant(user=user, conversation=self.conversation) for user in users])
+
+    def _count_send_queries(self):
+        with CaptureQueriesContext(connection) as queries:
+            send_message(self.conversation.id, "Alice", "Hello")
+        return len(queries)
+
+    # ! Test section
+    def test_send_message(self):
+        self._add_members(2)
+        with self.captureOnCommitCallbacks() as callbacks:
+            res = self.client.post(f"/message/{self.conversation.id}/send", data={"userName": "Alice", "text": "Hello"}, content_type='application/json')
+        self.assertEqual(res.status_code, 200)
+        message = res.json()["message"]
+        self.assertEqual(message["text"], "Hello")
+        self.assertEqual(len(callbacks), 1) # 提交后广播
+        participants = Participant.objects.filter(conversation=self.conversation)
+        self.assertTrue(all(p.last_message_id == message["id"] for p in participants))
+        self.assertEqual(sorted(p.unread_count for p in participants), [0, 1, 1])
+
+    def test_send_query_count_is_constant(self):
+        self._add_members(5)
+        small = self._count_send_queries()
+        self._add_members(500)
+        self.assertEqual(self._count_send_queries(), small)
+
+    def test_out_of_order_commit_keeps_newest(self):
+        older = send_message(self.conversation.id, "Alice", "First")
+        newer = send_message(self.conversation.id, "Alice", "Second")
+        record_message_sent(older) # 模拟较早的消息较晚提交
+        participant = Participant.objects.get(user=self.alice, conversation=self.conversation)
+        self.assertEqual((participant.last_message_id, participant.last_read_message_id), (newer.id, newer.id))
+
+    def test_send_not_participant(self):
+        User.objects.create(name="Bob", password="123456")
+        res = self.client.post(f"/message/{self.conversation.id}/send", data={"userName": "Bob", "text": "Hello"}, content_type='application/json')
+        self.assertEqual(res.status_code, 403)
+        self.assertFalse(Message.objects.exists())
+
+    def test_send_quote_from_other_conversation(self):
+        other = Conversation.objects.create()
+        quote = Message.objects.create(conversation=other, sender=self.alice, text="x")
+        res = self.client.post(f"/message/{self.conversation.id}/send", data={"userName": "Alice", "text": "Hello", "quote": quote.id}, content_type='application/json')
+        self.assertEqual(res.status_code, 404)
+
+
+class SyncTests(TestCase):
+    # Initializer
+    def setUp(self):
+        self.alice = User.objects.create(name="Alice", password="123456")
+        self.bob = User.objects.create(name="Bob", password="123456")
+        self.conversations = [Conversation.objects.create(is_group=True) for _ in range(3)]
+        for conversation in self.conversations:
+            Participant.objects.create(user=self.alice, conversation=conversation)
+            Participant.objects.create(user=self.bob, conversation=conversation)
+
+    def _sync(self, **data):
+        res = self.client.post("/message/sync", data={"userName": "Alice", **data}, content_type='application/json')
+        self.assertEqual(res.status_code, 200)
+        return res.json()
+
+    # ! Test section
+    def test_sync_missed_messages(self):
+        first = send_message(self.conversations[0].id, "Bob", "Hello")
+        state = self._sync()
+        self.assertEqual([m["text"] for m in state["messages"]], ["Hello"])
+        marks = state["marks"]
+        self.assertEqual(marks[str(self.conversations[0].id)], first.id)
+
+        # 离线期间多个会话有新消息，一次同步全部取回，查询数与会话数无关
+        for conversation in self.conversations:
+            send_message(conversation.id, "Bob", f"Missed {conversation.id}")
+        with CaptureQueriesContext(connection) as queries:
+            state = self._sync(conversations=marks)
+        self.assertEqual(len(queries), 3)
+        self.assertEqual([m["text"] for m in state["messages"]], [f"Missed {c.id}" for c in self.conversations])
+        self.assertFalse(state["hasMore"])
+        self.assertEqual(self._sync(conversations=state["marks"])["messages"], [])
+
+    def test_sync_many_conversations(self):
+        # 上千个有新消息的会话：查询条件不随会话数加深（SQLite 表达式深度上限为 1000）
+        conversations = Conversation.objects.bulk_create([Conversation(is_group=True) for _ in range(1200)])
+        Participant.objects.bulk_create([Participant(user=self.alice, conversation=c) for c in conversations])
+        Message.objects.bulk_create([Message(conversation=c, sender=self.bob, text="Hi") for c in conversations])
+        for message in Message.objects.all():
+            Participant.objects.filter(conversation_id=message.conversation_id).update(last_message=message)
+        state = self._sync(limit=1000)
+        self.assertEqual((len(state["messages"]), state["hasMore"]), (1000, True))
+        marks = {str(c.id): 0 for c in conversations}
+        state = self._sync(conversations=marks, limit=1000)
+        self.assertEqual((len(state["messages"]), state["hasMore"]), (1000, True))
+        state = self._sync(conversations=state["marks"], limit=1000)
+        self.assertEqual((len(state["messages"]), state["hasMore"]), (200, False))
+
+    def test_sync_is_size_bounded(self):
+        for i in range(5):
+            send_message(self.conversations[i % 3].id, "Bob", f"Message {i}")
+        texts, marks = [], {}
+        while True:
+            state = self._sync(conversations=marks, limit=2)
+            texts += [m["text"] for m in state["messages"]]
+            marks = state["marks"]
+            if not state["hasMore"]:
+                break
+        self.assertEqual(texts, [f"Message {i}" for i in range(5)])
+
+    @mock.patch("message.services.READ_SYNC_OVERLAP", timedelta(0))
+    def test_sync_read_watermarks_and_announcements(self):
+        message = send_message(self.conversations[0].id, "Alice", "Hello")
+        read_cursor = self._sync()["readCursor"]
+        mark_read(Participant.objects.get(user=self.bob, conversation=self.conversations[0]), message.id)
+        announcement = Announcement.objects.create(conversation=self.conversations[1], message="Welcome")
+        Announcement.objects.create(conversation=Conversation.objects.create(), message="Not mine")
+
+        state = self._sync(readCursor=read_cursor)
+        self.assertEqual([(w["userName"], w["lastReadMessageId"]) for w in state["readWatermarks"]], [("Bob", message.id)])
+        self.assertEqual([a["message"] for a in state["announcements"]], ["Welcome"])
+        self.assertEqual(state["announcementId"], announcement.id)
+        state = self._sync(readCursor=state["readCursor"], announcementId=state["announcementId"])
+        self.assertEqual((state["readWatermarks"], state["announcements"]), ([], []))
+
+    def test_sync_read_watermarks_late_commit_and_ties(self):
+        message = send_message(self.conversations[0].id, "Alice", "Hello")
+        read_cursor = self._sync()["readCursor"]
+        # 已读时间早于上次同步，但提交晚于上次同步
+        read_at = timezone.now() - timedelta(seconds=1)
+        Participant.objects.filter(user=self.bob).update(last_read_message_id=message.id, read_at=read_at)
+        conversation_ids, hops = [], 0
+        while True: # 三条时间相同的已读，每页一条，分页边界不丢失
+            state = self._sync(readCursor=read_cursor, limit=1)
+            conversation_ids += [w["conversationId"] for w in state["readWatermarks"]]
+            read_cursor = state["readCursor"]
+            hops += 1
+            if not state["hasMore"]:
+                break
+        self.assertEqual(sorted(conversation_ids), sorted(c.id for c in self.conversations))
+        self.assertEqual(hops, 3)
+
+    def test_sync_bad_params(self):
+        res = self.client.post("/message/sync", data={"userName": "Alice", "conversations": {"x": 1}}, content_type='application/json')
+        self.assertEqual(res.status_code, 400)
+        res = self.client.post("/message/sync", data={"userName": "Alice", "readCursor": "yesterday"}, content_type='application/json')
+        self.assertEqual(res.status_code, 400)
+
+
+class EventLogTests(TestCase):
+    # Initializer
+    def setUp(self):
+        self.alice = User.objects.create(name="Alice", password="123456")
+        self.bob = User.objects.create(name="Bob", password="123456")
+        self.carol = User.objects.create(name="Carol", password="123456")
+        self.conversation = Conversation.objects.create()
+        Participant.objects.create(user=self.alice, conversation=self.conversation)
+        Participant.objects.create(user=self.bob, conversation=self.conversation)
+        self.others = Conversation.objects.create()
+        Participant.objects.create(user=self.carol, conversation=self.others)
+
+    # ! Test section
+    def test_events_follow_mutations(self):
+        send_message(self.conversation.id, "Alice", "Hello")
+        FriendRequest.objects.create(from_user=self.bob, to_user=self.alice).accept()
+        Friendship.objects.filter(from_user=self.alice, to_user=self.bob).delete()
+        Announcement.objects.create(conversation=self.conversation, message="Welcome")
+        kinds = [event.kind for event in iter_events()]
+        self.assertEqual(kinds, [
+            "message.created", "friendRequest.updated", "friendRequest.updated", # 创建申请，双方各一条
+            "friendRequest.updated", "friendRequest.updated", "friendship.created", "friendship.created", # 接受
+            "friendship.deleted", "announcement.created"
+        ])
+        seqs = [event.seq for event in iter_events()]
+        self.assertEqual(seqs, sorted(seqs))
+
+    def test_recent_events_held_back_with_concurrent_writers(self):
+        send_message(self.conversation.id, "Alice", "Hello")
+        first = Event.objects.get()
+        Event.objects.filter(seq=first.seq).update(created_at=timezone.now() - timedelta(seconds=10))
+        send_message(self.conversation.id, "Alice", "World")
+        # 非 SQLite 数据库上，刚写入的事件暂不返回，因为更小的 seq 可能尚未提交
+        with mock.patch("message.events.settle_delay", return_value=2):
+            self.assertEqual([event.seq for event in iter_events()], [first.seq])
+        self.assertEqual(len(list(iter_events())), 2)
+
+    def test_event_rolled_back_with_mutation(self):
+        with self.assertRaises(RuntimeError), transaction.atomic():
+            send_message(self.conversation.id, "Alice", "Hello")
+            raise RuntimeError
+        self.assertFalse(Event.objects.exists())
+
+    def test_iter_events_streams_in_chunks(self):
+        for i in range(5):
+            send_message(self.conversation.id, "Alice", f"Message {i}")
+        send_message(self.others.id, "Carol", "Not for Alice")
+        with self.assertNumQueries(4): # 参与的会话一次 + 三批事件
+            texts = [event.payload["text"] for event in iter_events(user_name="Alice", chunk_size=2)]
+        self.assertEqual(texts, [f"Message {i}" for i in range(5)])
+        since = Event.objects.order_by("seq")[2].seq
+        self.assertEqual(len(list(iter_events(since, user_name="Alice"))), 2)
+
+    def test_events_endpoint(self):
+        for i in range(3):
+            send_message(self.conversation.id, "Alice", f"Message {i}")
+        Friendship.objects.create(from_user=self.alice, to_user=self.carol)
+        Friendship.objects.create(from_user=self.carol, to_user=self.alice)
+
+        res = self.client.get("/message/events", {"userName": "Alice", "limit": 2}).json()
+        self.assertEqual([e["kind"] for e in res["events"]], ["message.created"] * 2)
+        self.assertTrue(res["hasMore"])
+        res = self.client.get("/message/events", {"userName": "Alice", "since": res["seq"]}).json()
+        self.assertEqual([e["kind"] for e in res["events"]], ["message.created", "friendship.created"])
+        self.assertEqual(res["events"][1]["payload"]["toUser"], "Carol")
+        self.assertFalse(res["hasMore"])
+        res = self.client.get("/message/events", {"userName": "Alice", "since": res["seq"]}).json()
+        self.assertEqual((res["events"], res["hasMore"]), ([], False))
+
+
+class ExportTests(TestCase):
+    # Initializer
+    def setUp(self):
+        self.alice = User.objects.create(name="Alice", password="123456")
+        self.conversation = Conversation.objects.create()
+        Participant.objects.create(user=self.alice, conversation=self.conversation)
+        for i in range(5):
+            send_message(self.conversation.id, "Alice", f"Message {i}, \"quoted\"\nline")
+
+    def _export(self, **params):
+        return self.client.get(f"/message/{self.conversation.id}/export", {"userName": "Alice", **params})
+
+    # ! Test section
+    def test_export_ndjson(self):
+        res = self._export()
+        self.assertTrue(res.streaming)
+        self.assertEqual(res["Content-Type"], "application/x-ndjson")
+        rows = [json.loads(line) for line in b"".join(res.streaming_content).splitlines()]
+        self.assertEqual([row["text"] for row in rows], [f"Message {i}, \"quoted\"\nline" for i in range(5)])
+        self.assertEqual(list(rows[0]), ["id", "conversationId", "sender", "text", "quote", "sentAt"])
+
+    def test_export_csv(self):
+        res = self._export(format="csv")
+        rows = list(csv.reader(io.StringIO(b"".join(res.streaming_content).decode("utf-8"))))
+        self.assertEqual(rows[0], ["id", "conversationId", "sender", "text", "quote", "sentAt"])
+        self.assertEqual([row[3] for row in rows[1:]], [f"Message {i}, \"quoted\"\nline" for i in range(5)])
+        # 时间格式与 NDJSON 导出一致
+        ndjson = [json.loads(line) for line in b"".join(self._export().streaming_content).splitlines()]
+        self.assertEqual([row[5] for row in rows[1:]], [row["sentAt"] for row in ndjson])
+
+    def test_export_in_chunks(self):
+        with self.assertNumQueries(1): # 一次查询，按 chunk_size 分批从游标读取
+            chunks = export_conversation(self.conversation.id, "ndjson", chunk_size=2)
+            self.assertEqual(json.loads(next(chunks))["text"], "Message 0, \"quoted\"\nline")
+            self.assertEqual(len(list(chunks)), 4)
+
+    def test_export_errors(self):
+        self.assertEqual(self._export(format="xml").status_code, 400)
+        User.objects.create(name="Bob", password="123456")
+        res = self.client.get(f"/message/{self.conversation.id}/export", {"userName": "Bob"})
+        self.assertEqual(res.status_code, 403)
+
+    def test_export_command(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "export.csv")
+            call_command("export_conversation", self.conversation.id, "--format", "csv", "--output", path)
+            with open(path, newline="", encoding="utf-8") as f:
+                self.assertEqual(len(list(csv.reader(f))), 6)
+        stdout = io.StringIO()
+        call_command("export_conversation", self.conversation.id, stdout=stdout)
+        self.assertEqual(len(stdout.getvalue().splitlines()), 5)
+
+
+class MessageSearchTests(TestCase):
+    # Initializer
+    def setUp(self):
+        self.alice = User.objects.create(name="Alice", password="123456")
+        self.bob = User.objects.create(name="Bob", password="123456")
+        self.conversation = Conversation.objects.create()
+        Participant.objects.create(user=self.alice, conversation=self.conversation)
+        Participant.objects.create(user=self.bob, conversation=self.conversation)
+        self.others = Conversation.objects.create()
+        Participant.objects.create(user=self.bob, conversation=self.others)
+        send_message(self.conversation.id, "Alice", "Let's meet for dinner tonight")
+        send_message(self.conversation.id, "Bob", "Dinner sounds great, see you at the station")
+        send_message(self.conversation.id, "Bob", "明天下午一起去图书馆吧")
+        send_message(self.others.id, "Bob", "Secret dinner plans")
+
+    def _search(self, keyword, user_name="Alice", **params):
+        res = self.client.get("/message/search", {"userName": user_name, "keyword": keyword, **params})
+        self.assertEqual(res.status_code, 200)
+        return res.json()
+
+    # ! Test section
+    def test_search_restricted_to_participant(self):
+        res = self._search("dinner")
+        self.assertEqual(res["total"], 2)
+        self.assertEqual({r["message"]["text"] for r in res["results"]}, {"Let's meet for dinner tonight", "Dinner sounds great, see you at the station"})
+        self.assertEqual(self._search("dinner", "Bob")["total"], 3)
+        self.assertEqual(self._search("dinner", "Bob", conversationId=self.others.id)["total"], 1)
+
+    def test_snippet_and_pagination(self):
+        res = self._search("dinner", limit=1)
+        self.assertEqual((len(res["results"]), res["total"]), (1, 2))
+        self.assertIn("<mark>", res["results"][0]["snippet"])
+        second = self._search("dinner", limit=1, page=1)["results"]
+        self.assertNotEqual(second[0]["message"]["id"], res["results"][0]["message"]["id"])
+
+    def test_multiple_terms_and_cjk(self):
+        self.assertEqual(self._search("dinner station")["total"], 1)
+        self.assertEqual(self._search("图书馆")["results"][0]["snippet"], "明天下午一起去<mark>图书馆</mark>吧")
+        self.assertEqual(self._search("下午")["total"], 1) # 短词走 LIKE
+        self.assertEqual(self._search('"quoted" OR')["total"], 0)
+
+    def test_index_follows_changes(self):
+        message = send_message(self.conversation.id, "Alice", "Remember the umbrella")
+        self.assertEqual(self._search("umbrella")["total"], 1)
+        message.text = "Remember the raincoat"
+        message.save()
+        self.assertEqual(self._search("umbrella")["total"], 0)
+        self.assertEqual(self._search("raincoat")["total"], 1)
+        message.delete()
+        self.assertEqual(self._search("raincoat")["total"], 0)
+        call_command("rebuild_message_search_index", stdout=io.StringIO())
+        self.assertEqual(self._search("dinner")["total"], 2)
+
+    @skipUnless(connection.vendor == "sqlite", "FTS5 index requires SQLite")
+    def test_conversation_filtered_by_index(self):
+        backend = get_search_backend()
+        # 会话词项只完整匹配：会话 1 不会命中会话 11 的消息
+        for _ in range(10):
+            conversation = Conversation.objects.create()
+        Participant.objects.create(user=self.alice, conversation=conversation)
+        message = send_message(conversation.id, "Alice", "dinner in conversation %d" % conversation.id)
+        prefix = int(str(conversation.id)[:-1])
+        self.assertNotIn(message.id, [message_id for message_id, _ in backend.search([prefix], ["dinner"], 0, 10)[0]])
+        self.assertEqual(backend.search([conversation.id], ["dinner"], 0, 10)[0][0][0], message.id)
+
+    @skipUnless(connection.vendor == "sqlite", "FTS5 index requires SQLite")
+    def test_install_upgrades_old_index(self):
+        with connection.cursor() as cursor:
+            cursor.execute("DROP TABLE message_search")
+            cursor.execute("CREATE VIRTUAL TABLE message_search USING fts5(text, conversation_id UNINDEXED, tokenize='trigram')")
+        SqliteFtsBackend().install("default")
+        self.assertEqual(self._search("dinner")["total"], 2)
+
+    def test_like_backend(self):
+        self.assertEqual(LikeBackend().search([self.conversation.id], ["DINNER"], 0, 10)[1], 2)
+        self.assertEqual(make_snippet("Dinner sounds great", ["dinner"]), "<mark>Dinner</mark> sounds great")
@@ -3,6 +3,13 @@ import message.views as views
 
 urlpatterns = [
 
-    # path('', views.get_conversation_list), # 聊天列表页
-    # path('<conversation_id>', views.get_conversation_messages), # 聊天详情页
-]
\ No newline at end of file
+    path('', views.get_conversation_list), # 聊天列表页
+    path('<int:conversation_id>', views.get_conversation_messages), # 聊天详情页（历史消息）
+    path('<int:conversation_id>/send', views.send), # 发送消息
+    path('<int:conversation_id>/read', views.read_conversation), # 标记已读
+    path('<int:conversation_id>/receipts', views.get_message_receipts), # 已读回执
+    path('<int:conversation_id>/export', views.export_conversation_messages), # 导出聊天记录
+    path('sync', views.sync), # 离线同步
+    path('events', views.get_events), # 事件日志增量拉取
+    path('search', views.search_conversation_messages), # 搜索聊天记录
+]
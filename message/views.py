@@ -1,3 +1,228 @@
-from django.shortcuts import render
+from itertools import islice
 
-# Create your views here.
+from django.db.models import F, Q
+from django.http import HttpRequest, StreamingHttpResponse
+
+from message.events import iter_events
+from message.export import EXPORT_FORMATS, export_conversation
+from message.models import Message, Participant
+from message.search import search_messages
+from message.services import get_read_receipts, mark_read, send_message, sync_changes
+from user.middleware import get_request_user_name
+from utils.utils_cursor import decode_cursor, encode_cursor, get_page_size
+from utils.utils_db import use_replica
+from utils.utils_request import BAD_METHOD, request_failed, request_success
+from utils.utils_require import MAX_CHAR_LENGTH, CheckRequire, Field, Schema, parse_body, require
+
+HISTORY_PAGE_SIZE = 20 # 默认每页消息数
+MAX_HISTORY_PAGE_SIZE = 100
+SYNC_PAGE_SIZE = 200 # 每次同步每类变化的默认最大条数
+MAX_SYNC_PAGE_SIZE = 1000
+EVENT_PAGE_SIZE = 200 # 每次拉取事件的默认条数
+MAX_EVENT_PAGE_SIZE = 1000
+SEARCH_PAGE_SIZE = 20 # 消息搜索每页数量
+MAX_SEARCH_PAGE_SIZE = 100
+
+# 请求校验规则
+SEND_SCHEMA = Schema(
+    Field("text", "string", err_msg="Missing or error type of [text]"),
+    Field("quote", "int", required=False, err_msg="Missing or error type of [quote]"),
+)
+READ_SCHEMA = Schema(Field("messageId", "int", required=False, err_msg="Missing or error type of [messageId]"))
+RECEIPTS_SCHEMA = Schema(Field("messageId", "int", err_msg="Missing or error type of [messageId]"))
+SYNC_SCHEMA = Schema(
+    Field("conversations", "dict", required=False, default={}, err_msg="Missing or error type of [conversations]"),
+    Field("announcementId", "int", required=False, default=0, err_msg="Missing or error type of [announcementId]"),
+    Field("readCursor", "string", required=False, err_msg="Missing or error type of [readCursor]"),
+    Field("limit", "int", required=False, default=SYNC_PAGE_SIZE, err_msg="Missing or error type of [limit]"),
+)
+
+
+# 获取聊天列表（按最新消息排序，附带最新消息与未读数）
+# GET /message/?userName=xxx
+@CheckRequire
+def get_conversation_list(req: HttpRequest):
+    if req.method != "GET":
+        return BAD_METHOD
+    user_name = get_request_user_name(req, req.GET)
+    participants = Participant.objects.filter(user_id=user_name).select_related(
+        "conversation", "last_message"
+    ).order_by(F("last_message").desc(nulls_last=True), "-conversation_id")
+    return request_success({
+        "conversations": [participant.serialize() for participant in participants]
+    })
+
+
+# 获取聊天历史（从新到旧，按 (sent_at, id) 游标分页）
+# GET /message/<conversation_id>?userName=xxx&cursor=xxx&limit=20
+@CheckRequire
+@use_replica
+def get_conversation_messages(req: HttpRequest, conversation_id: int):
+    if req.method != "GET":
+        return BAD_METHOD
+    params = req.GET
+    user_name = get_request_user_name(req, params)
+    limit = get_page_size(params, HISTORY_PAGE_SIZE, MAX_HISTORY_PAGE_SIZE)
+
+    if not Participant.objects.filter(user_id=user_name, conversation_id=conversation_id).exists():
+        return request_failed(1, "Not a participant", 403)
+
+    messages = Message.objects.filter(conversation_id=conversation_id)
+    if params.get("cursor"):
+        sent_at, message_id = decode_cursor(params["cursor"], 2)
+        messages = messages.filter(Q(sent_at__lt=sent_at) | Q(sent_at=sent_at, id__lt=message_id))
+    page = list(messages.order_by("-sent_at", "-id")[:limit + 1])
+
+    next_cursor = None
+    if len(page) > limit: # 还有更早的消息
+        page = page[:limit]
+        next_cursor = encode_cursor(page[-1].sent_at, page[-1].id)
+    return request_success({
+        "messages": [message.serialize() for message in page],
+        "nextCursor": next_cursor
+    })
+
+
+# 发送消息
+# POST /message/<conversation_id>/send {"userName": "xxx", "text": "Hi", "quote": 123}，quote 可缺省
+@CheckRequire
+def send(req: HttpRequest, conversation_id: int):
+    if req.method != "POST":
+        return BAD_METHOD
+    user_name = get_request_user_name(req, parse_body(req))
+    data = SEND_SCHEMA.parse(req)
+    text, quote_id = data["text"], data["quote"]
+    if text == "":
+        return request_failed(-2, "Empty message", 400)
+
+    if not Participant.objects.filter(user_id=user_name, conversation_id=conversation_id).exists():
+        return request_failed(1, "Not a participant", 403)
+    if quote_id is not None and not Message.objects.filter(id=quote_id, conversation_id=conversation_id).exists():
+        return request_failed(2, "Message not found", 404)
+    message = send_message(conversation_id, user_name, text, quote_id)
+    return request_success({"message": message.serialize()})
+
+
+# 标记已读
+# POST /message/<conversation_id>/read {"userName": "xxx", "messageId": 123}，messageId 缺省为最新消息
+@CheckRequire
+def read_conversation(req: HttpRequest, conversation_id: int):
+    if req.method != "POST":
+        return BAD_METHOD
+    user_name = get_request_user_name(req, parse_body(req))
+    message_id = READ_SCHEMA.parse(req)["messageId"]
+
+    participant = Participant.objects.filter(user_id=user_name, conversation_id=conversation_id).first()
+    if participant is None:
+        return request_failed(1, "Not a participant", 403)
+    unread_count = mark_read(participant, message_id)
+    return request_success({
+        "lastReadMessageId": participant.last_read_message_id,
+        "unreadCount": unread_count
+    })
+
+
+# 获取消息的已读回执
+# GET /message/<conversation_id>/receipts?userName=xxx&messageId=123
+@CheckRequire
+def get_message_receipts(req: HttpRequest, conversation_id: int):
+    if req.method != "GET":
+        return BAD_METHOD
+    user_name = get_request_user_name(req, req.GET)
+    message_id = RECEIPTS_SCHEMA.parse_query(req)["messageId"]
+
+    if not Participant.objects.filter(user_id=user_name, conversation_id=conversation_id).exists():
+        return request_failed(1, "Not a participant", 403)
+    message = Message.objects.filter(id=message_id, conversation_id=conversation_id).first()
+    if message is None:
+        return request_failed(2, "Message not found", 404)
+    return request_success({
+        "readers": [
+            {"userName": user_id, "readAt": read_at} for user_id, read_at in get_read_receipts(message)
+        ]
+    })
+
+
+# 离线同步：重连后一次取回错过的新消息、已读水位变化与群公告
+# POST /message/sync {"userName": "xxx", "conversations": {"12": 345}, "announcementId": 6, "readCursor": "...", "limit": 200}
+# conversations 为各会话已有的最大消息id，缺省的会话从已读水位开始；readCursor 为上次同步的返回值
+# 响应中的 marks / announcementId / readCursor 作为下次同步的参数，hasMore 为真时应立即继续同步
+@CheckRequire
+def sync(req: HttpRequest):
+    if req.method != "POST":
+        return BAD_METHOD
+    user_name = get_request_user_name(req, parse_body(req))
+    data = SYNC_SCHEMA.parse(req)
+    try:
+        marks = {int(conversation_id): int(mark) for conversation_id, mark in data["conversations"].items()}
+    except (TypeError, ValueError):
+        return request_failed(-2, "Missing or error type of [conversations]", 400)
+    read_after = None
+    if data["readCursor"] is not None:
+        read_after = decode_cursor(data["readCursor"], 2, err_msg="Missing or error type of [readCursor]", err_code=-2)
+    if not 0 < data["limit"] <= MAX_SYNC_PAGE_SIZE:
+        return request_failed(-2, "Missing or error type of [limit]", 400)
+    return request_success(sync_changes(user_name, marks, data["announcementId"], read_after, data["limit"]))
+
+
+# 增量拉取事件日志：返回 seq 大于 since 的、与该用户相关的事件（按 seq 递增）
+# GET /message/events?userName=xxx&since=0&limit=200，响应中的 seq 作为下次的 since
+@CheckRequire
+@use_replica
+def get_events(req: HttpRequest):
+    if req.method != "GET":
+        return BAD_METHOD
+    params = req.GET
+    user_name = get_request_user_name(req, params)
+    since = require(params, "since", "int", err_msg="Bad param [since]", err_code=-1) if "since" in params else 0
+    limit = get_page_size(params, EVENT_PAGE_SIZE, MAX_EVENT_PAGE_SIZE)
+    events = list(islice(iter_events(since, user_name, chunk_size=limit + 1), limit + 1))
+    return request_success({
+        "events": [event.serialize() for event in events[:limit]],
+        "seq": events[limit - 1].seq if len(events) > limit else (events[-1].seq if events else since),
+        "hasMore": len(events) > limit
+    })
+
+
+# 导出会话历史（参与者可用），流式返回，不在内存中保留全部消息
+# GET /message/<conversation_id>/export?userName=xxx&format=ndjson|csv
+@CheckRequire
+def export_conversation_messages(req: HttpRequest, conversation_id: int):
+    if req.method != "GET":
+        return BAD_METHOD
+    params = req.GET
+    user_name = get_request_user_name(req, params)
+    format = params.get("format", "ndjson")
+    if format not in EXPORT_FORMATS:
+        return request_failed(-1, "Bad param [format]", 400)
+    if not Participant.objects.filter(user_id=user_name, conversation_id=conversation_id).exists():
+        return request_failed(1, "Not a participant", 403)
+    response = StreamingHttpResponse(export_conversation(conversation_id, format), content_type=EXPORT_FORMATS[format])
+    response["Content-Disposition"] = f'attachment; filename="conversation-{conversation_id}.{format}"'
+    response["Access-Control-Allow-Origin"] = "*"
+    return response
+
+
+# 搜索聊天记录：只在该用户参与的会话中搜索，可用 conversationId 限定单个会话
+# GET /message/search?userName=xxx&keyword=xxx&conversationId=12&page=0&limit=20，按相关度排序并返回高亮摘要
+@CheckRequire
+@use_replica
+def search_conversation_messages(req: HttpRequest):
+    if req.method != "GET":
+        return BAD_METHOD
+    params = req.GET
+    user_name = get_request_user_name(req, params)
+    keyword = require(params, "keyword", "string", err_msg="Missing or error type of [keyword]", err_code=-1).strip()
+    if not 0 < len(keyword) <= MAX_CHAR_LENGTH:
+        return request_failed(-1, "Bad param [keyword]", 400)
+    limit = get_page_size(params, SEARCH_PAGE_SIZE, MAX_SEARCH_PAGE_SIZE)
+    page = require(params, "page", "int", err_msg="Bad param [page]", err_code=-1) if "page" in params else 0
+    if page < 0:
+        return request_failed(-1, "Bad param [page]", 400)
+
+    conversation_ids = Participant.objects.filter(user_id=user_name).values_list("conversation_id", flat=True)
+    if "conversationId" in params:
+        conversation_id = require(params, "conversationId", "int", err_msg="Bad param [conversationId]", err_code=-1)
+        conversation_ids = conversation_ids.filter(conversation_id=conversation_id)
+    results, total = search_messages(list(conversation_ids), keyword, page * limit, limit)
+    return request_success({"results": results, "total": total})
@@ -2,6 +2,13 @@
 python3 manage.py makemigrations user
 python3 manage.py migrate
 
+# WebSocket endpoints (/ws/...) are served by the ASGI application in separate processes;
+# they share the message fanout with the uWSGI workers through MESSAGE_FANOUT_SOCKET_DIR
+uvicorn DjangoHW.asgi:application \
+    --host=0.0.0.0 \
+    --port="${ASGI_PORT:-8001}" \
+    --workers="${ASGI_WORKERS:-2}" &
+
 # Run with uWSGI
 uwsgi --module=DjangoHW.wsgi:application \
     --env DJANGO_SETTINGS_MODULE=DjangoHW.settings \
@@ -4,3 +4,9 @@ from django.apps import AppConfig
 class BoardConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'user'
+
+    def ready(self):
+        import user.signals  # noqa: F401  注册信号处理函数
+        from django.db.backends.signals import connection_created
+        from utils.utils_db import configure_sqlite
+        connection_created.connect(configure_sqlite, dispatch_uid="configure_sqlite")
@@ -0,0 +1,84 @@
+import threading
+import time
+from collections import OrderedDict
+
+from user.models import User
+from utils.utils_request import dumps_json
+
+# 进程内的用户缓存：name -> (过期时间, 字段值)
+# 同进程内的修改通过信号失效，其他进程的修改最多延迟 USER_CACHE_TTL 秒可见
+USER_CACHE_TTL = 5
+USER_CACHE_SIZE = 10000
+
+_USER_FIELDS = [field.attname for field in User._meta.concrete_fields]
+_user_cache = OrderedDict()
+_user_cache_lock = threading.Lock()
+
+
+# 按用户名获取用户，不存在时返回 None；每次返回新的实例，调用方可放心修改
+def get_cached_user(user_name):
+    now = time.monotonic()
+    with _user_cache_lock:
+        cached = _user_cache.get(user_name)
+        if cached is not None and cached[0] > now:
+            _user_cache.move_to_end(user_name)
+            return User.from_db("default", _USER_FIELDS, cached[1])
+
+    values = User.objects.filter(name=user_name).values_list(*_USER_FIELDS).first()
+    if values is None:
+        return None
+    with _user_cache_lock:
+        _user_cache[user_name] = (now + USER_CACHE_TTL, values)
+        _user_cache.move_to_end(user_name)
+        if len(_user_cache) > USER_CACHE_SIZE:
+            _user_cache.popitem(last=False)
+    return User.from_db("default", _USER_FIELDS, values)
+
+
+# 进程内的资料缓存：name -> (过期时间, {资料类型: 序列化后的 JSON bytes})
+# 资料读取远多于修改，命中时无需查询与序列化，直接拼接进响应
+PROFILE_CACHE_TTL = 10
+PROFILE_CACHE_SIZE = 10000
+
+_profile_cache = OrderedDict()
+_profile_cache_lock = threading.Lock()
+
+
+# 按用户名获取序列化后的资料，用户不存在时返回 None
+# kind 区分不同格式的资料，render(user) 返回可序列化的 dict
+def get_cached_profile(user_name, kind, render):
+    now = time.monotonic()
+    with _profile_cache_lock:
+        cached = _profile_cache.get(user_name)
+        if cached is not None and cached[0] > now and kind in cached[1]:
+            _profile_cache.move_to_end(user_name)
+            return cached[1][kind]
+
+    user = get_cached_user(user_name)
+    if user is None:
+        return None
+    content = dumps_json(render(user))
+    with _profile_cache_lock:
+        cached = _profile_cache.get(user_name)
+        if cached is None or cached[0] <= now:
+            cached = _profile_cache[user_name] = (now + PROFILE_CACHE_TTL, {})
+        cached[1][kind] = content
+        _profile_cache.move_to_end(user_name)
+        if len(_profile_cache) > PROFILE_CACHE_SIZE:
+            _profile_cache.popitem(last=False)
+    return content
+
+
+# 用户修改资料（fix_user_info）或注销（close）时由信号调用
+def invalidate_user(user_name):
+    with _user_cache_lock:
+        _user_cache.pop(user_name, None)
+    with _profile_cache_lock:
+        _profile_cache.pop(user_name, None)
+
+
+def clear_user_cache():
+    with _user_cache_lock:
+        _user_cache.clear()
+    with _profile_cache_lock:
+        _profile_cache.clear()
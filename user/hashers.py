@@ -0,0 +1,10 @@
+from django.conf import settings
+from django.contrib.auth.hashers import PBKDF2PasswordHasher
+
+
+# PBKDF2 哈希，迭代次数（计算代价）由 settings.PASSWORD_HASH_ITERATIONS 配置；
+# 调整后已有的哈希在用户下次登录时自动按新代价重新计算
+class TunablePBKDF2PasswordHasher(PBKDF2PasswordHasher):
+    @property
+    def iterations(self):
+        return settings.PASSWORD_HASH_ITERATIONS
@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+
+from user.models import UserSearchTerm
+from user.search import rebuild_index
+
+
+class Command(BaseCommand):
+    help = "重建用户搜索索引"
+
+    def handle(self, *args, **options):
+        rebuild_index()
+        self.stdout.write(f"Indexed {UserSearchTerm.objects.count()} search terms")
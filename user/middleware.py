@@ -0,0 +1,54 @@
+from django.http import HttpRequest
+
+from user.cache import get_cached_user
+from utils.utils_jwt import check_jwt_token
+from utils.utils_request import request_failed
+from utils.utils_require import require
+
+
+# 标记视图在 token 无效时按未登录处理（登录、注册），而不是返回 401
+# 携带过期 token 的客户端因此仍可重新登录；需放在最外层装饰器
+def token_optional(view_fn):
+    view_fn.token_optional = True
+    return view_fn
+
+
+# 认证中间件：校验 Authorization 头中的 JWT（可带 "Bearer " 前缀），
+# 每个请求只解析一次用户并挂到 request.user_obj 上；未携带 token 时为 None
+# token 无效或已过期时，除 token_optional 的视图外均返回 401
+class JwtAuthenticationMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request: HttpRequest):
+        request.user_obj = None
+        request.token_invalid = False
+        token = request.headers.get("Authorization")
+        if token:
+            if token.startswith("Bearer "):
+                token = token[len("Bearer "):]
+            data = check_jwt_token(token)
+            request.user_obj = get_cached_user(data["username"]) if data is not None else None
+            request.token_invalid = request.user_obj is None
+        return self.get_response(request)
+
+    def process_view(self, request: HttpRequest, view_fn, view_args, view_kwargs):
+        if request.token_invalid and not getattr(view_fn, "token_optional", False):
+            return request_failed(-4, "Invalid or expired token", 401)
+        return None
+
+
+# 当前请求的用户：优先使用 token 对应的用户，否则按请求中的 userName 查找（兼容未携带 token 的客户端）
+def get_request_user(req: HttpRequest, user_name):
+    user = getattr(req, "user_obj", None)
+    if user is not None:
+        return user
+    return get_cached_user(user_name)
+
+
+# 当前请求的用户名：优先使用 token 中的用户，否则取请求参数中的 userName
+def get_request_user_name(req: HttpRequest, params):
+    user = getattr(req, "user_obj", None)
+    if user is not None:
+        return user.name
+    return require(params, "userName", "string", err_msg="Missing or error type of [userName]")
@@ -36,11 +36,17 @@ class User(models.Model):
     gender = models.IntegerField(choices=GENDER_CHOICES, default=2, verbose_name='性别')
     age = models.IntegerField(null=True, blank=True, verbose_name='年龄') # 年龄，可为空
     location = models.CharField(max_length=100, null=True, blank=True, verbose_name='所在地') # 所在地，可为空
+    update_time = models.DateTimeField(auto_now=True, verbose_name='资料更新时间') # 用于好友列表的 ETag
 
     class Meta: # 快速搜索
         indexes = [models.Index(fields=["name"])]
         
-    def serialize(self): # 序列化
+    # serialize() 输出的字段，均与模型字段同名，可用于字段投影
+    SERIALIZE_FIELDS = ("name", "nick_name", "create_time", "introduction", "birthday", "phone", "email", "portrait", "gender", "age", "location")
+
+    def serialize(self, fields=None): # 序列化，fields 为 SERIALIZE_FIELDS 的子集时只输出这些字段
+        if fields is not None:
+            return {field: getattr(self, field) for field in fields}
         return {
             "name": self.name, 
             "nick_name": self.nick_name,
@@ -71,4 +77,14 @@ class User(models.Model):
     
     ## TODO:数据校验：如邮箱格式、电话号码格式等
     ## TODO:密码加密
-    ## TODO:用户设置
\ No newline at end of file
+    ## TODO:用户设置
+
+# 用户搜索索引：对 name / nick_name / email / phone 建立前缀与三元组（trigram）词项，
+# 由 user.search 维护，搜索时按词项走索引而不是 LIKE '%kw%' 全表扫描
+class UserSearchTerm(models.Model):
+    term = models.CharField(max_length=8) # 字段编号 + 词项，如 "0^a"（前缀）、"1:abc"（三元组）
+    user = models.ForeignKey(User, related_name='search_terms', on_delete=models.CASCADE)
+    field = models.PositiveSmallIntegerField() # 词项来源字段在 SEARCH_FIELDS 中的编号
+
+    class Meta:
+        unique_together = ('term', 'user')
@@ -0,0 +1,40 @@
+from asgiref.sync import sync_to_async
+from django.contrib.auth.hashers import check_password, identify_hasher, make_password
+from django.utils.crypto import constant_time_compare
+
+from user.cache import invalidate_user
+from user.models import User
+
+# 密码以哈希形式存储（settings.PASSWORD_HASHERS），兼容尚未迁移的明文密码：
+# 明文或代价已过时的哈希在登录成功时重新计算并保存
+
+
+def hash_password(raw_password):
+    return make_password(raw_password)
+
+
+# 校验密码，返回 (是否正确, 需要更新时的新哈希或 None)；只做计算，不访问数据库
+def verify_password(raw_password, encoded):
+    try:
+        identify_hasher(encoded)
+    except ValueError: # 旧的明文密码
+        valid = constant_time_compare(raw_password, encoded)
+        return valid, make_password(raw_password) if valid else None
+    rehashed = []
+    valid = check_password(raw_password, encoded, setter=lambda raw: rehashed.append(make_password(raw)))
+    return valid, rehashed[0] if valid and rehashed else None
+
+
+def update_password_hash(user: User, encoded):
+    User.objects.filter(name=user.name).update(password=encoded)
+    user.password = encoded
+    invalidate_user(user.name) # 缓存中保存了旧哈希
+
+
+# 异步校验：哈希计算放到线程池中执行（hashlib 计算期间释放 GIL），不阻塞事件循环，
+# 也不占用处理同步视图与 ORM 的线程
+async def acheck_user_password(user: User, raw_password):
+    valid, rehashed = await sync_to_async(verify_password, thread_sensitive=False)(raw_password, user.password)
+    if rehashed is not None:
+        await sync_to_async(update_password_hash)(user, rehashed)
+    return valid
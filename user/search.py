@@ -0,0 +1,85 @@
+from django.db import transaction
+from django.db.models import Case, Count, IntegerField, Value, When
+from django.db.models.functions import Greatest
+
+from user.models import User, UserSearchTerm
+
+# 参与搜索的字段及其权重（权重越大排名越靠前）
+SEARCH_FIELDS = ("name", "nick_name", "email", "phone")
+FIELD_WEIGHTS = (4, 3, 2, 2)
+PREFIX_LENGTH = 2 # 短于三元组的关键词按前缀匹配
+
+# 匹配类型得分
+EXACT, PREFIX, SUBSTRING = 3, 2, 1
+
+
+def trigrams(value):
+    return {value[i:i + 3] for i in range(len(value) - 2)}
+
+
+def index_terms(user: User):
+    terms = {}
+    for field, name in enumerate(SEARCH_FIELDS):
+        value = getattr(user, name)
+        value = value.lower() if isinstance(value, str) else ""
+        for length in range(1, min(PREFIX_LENGTH, len(value)) + 1):
+            terms[f"{field}^{value[:length]}"] = field
+        for gram in trigrams(value):
+            terms[f"{field}:{gram}"] = field
+    return terms
+
+
+# 重建单个用户的索引词项
+def index_user(user: User):
+    with transaction.atomic():
+        UserSearchTerm.objects.filter(user=user).delete()
+        UserSearchTerm.objects.bulk_create([
+            UserSearchTerm(term=term, user=user, field=field) for term, field in index_terms(user).items()
+        ])
+
+
+# 重建全部用户的索引，用于历史数据或批量导入之后
+def rebuild_index(batch_size=1000):
+    with transaction.atomic():
+        UserSearchTerm.objects.all().delete()
+        batch = []
+        for user in User.objects.only(*SEARCH_FIELDS).iterator(chunk_size=batch_size):
+            batch += [UserSearchTerm(term=term, user=user, field=field) for term, field in index_terms(user).items()]
+            if len(batch) >= batch_size:
+                UserSearchTerm.objects.bulk_create(batch)
+                batch = []
+        UserSearchTerm.objects.bulk_create(batch)
+
+
+# 字段与关键词的匹配得分（匹配类型 * 10 + 字段权重），不包含关键词时为 0
+def _match_score(name, weight, keyword):
+    return Case(
+        When(**{f"{name}__iexact": keyword}, then=Value(EXACT * 10 + weight)),
+        When(**{f"{name}__istartswith": keyword}, then=Value(PREFIX * 10 + weight)),
+        When(**{f"{name}__icontains": keyword}, then=Value(SUBSTRING * 10 + weight)),
+        default=Value(0),
+        output_field=IntegerField(),
+    )
+
+
+# 搜索用户，返回 (按相关度排序的一页用户, 匹配总数)
+def search_users(keyword, offset=0, limit=20):
+    keyword = keyword.lower()
+    if len(keyword) < 3:
+        terms = [f"{field}^{keyword}" for field in range(len(SEARCH_FIELDS))]
+        required = 1
+    else:
+        grams = trigrams(keyword)
+        terms = [f"{field}:{gram}" for field in range(len(SEARCH_FIELDS)) for gram in grams]
+        required = len(grams)
+
+    # 同一字段包含关键词的全部三元组才是候选（仍需校验，三元组可能分散在不同位置）
+    candidates = UserSearchTerm.objects.filter(term__in=terms).values("user_id", "field").annotate(
+        hits=Count("term")
+    ).filter(hits=required).values("user_id")
+
+    # 在数据库中校验并排序后再分页：精确、前缀匹配不会因候选截断而丢失，总数也是准确的
+    users = User.objects.filter(name__in=candidates).annotate(score=Greatest(*(
+        _match_score(name, weight, keyword) for name, weight in zip(SEARCH_FIELDS, FIELD_WEIGHTS)
+    ))).filter(score__gte=10) # 至少有一个字段真正包含关键词
+    return list(users.order_by("-score", "name")[offset:offset + limit]), users.count()
@@ -0,0 +1,20 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from user.cache import invalidate_user
+from user.models import User
+from user.search import index_user
+
+
+# 用户资料变化后更新搜索索引
+@receiver(post_save, sender=User)
+def update_search_index(sender, instance, raw=False, **kwargs):
+    if not raw:
+        index_user(instance)
+
+
+# 用户修改或注销后使缓存失效
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def invalidate_user_cache(sender, instance, **kwargs):
+    invalidate_user(instance.name)
@@ -1,14 +1,25 @@
 import random
-from django.test import TestCase, Client
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connection
+from django.http import HttpRequest
+from django.test import TestCase, Client, override_settings
 from user.models import User
+from user.cache import get_cached_profile
+from user.passwords import hash_password, verify_password
 import datetime
 import hashlib
 import hmac
 import time
 import json
 import base64
+from unittest import mock
 
-from utils.utils_jwt import EXPIRE_IN_SECONDS, SALT, b64url_encode
+from utils import utils_jwt, utils_request
+from utils.utils_db import ReplicaRouter, configure_sqlite, use_replica
+from utils.utils_ratelimit import CacheBackend, LocalBackend, reset_rate_limits
+from utils.utils_request import OrjsonRenderer, StdlibRenderer, extend_json, request_success, request_success_json
+from utils.utils_require import Field, Schema, parse_body, require
+from utils.utils_jwt import EXPIRE_IN_SECONDS, SALT, b64url_encode, check_jwt_token, generate_jwt_token
 
 # -*- coding: UTF-8 -*-
 # Create your tests here.
@@ -155,6 +166,135 @@ class InfoTests(TestCase):
         self.assertEqual(res.json()['code'], -3)
         self.assertEqual(res.json()['info'], 'Bad method')
 
+class ProfileCacheTests(TestCase):
+    # Initializer
+    def setUp(self):
+        User.objects.create(name="Ashitemaru", password="123456", nick_name="Ashitemaru")
+        self.data = {"userName": "Ashitemaru"}
+
+    # ! Test section
+    def test_get_info_cached(self):
+        res = self.client.post('/user', data=self.data, content_type='application/json')
+        self.assertEqual(res.json()["nickName"], "Ashitemaru")
+        with self.assertNumQueries(0):
+            cached = self.client.post('/user', data=self.data, content_type='application/json')
+        self.assertEqual(cached.content, res.content)
+
+    def test_invalidated_by_fix_and_close(self):
+        self.client.post('/user', data=self.data, content_type='application/json')
+        fix = {**self.data, "nickName": "Maru", "phone": "", "email": "", "gender": "", "portrait": "",
+               "introduction": "", "birthday": "", "age": "", "location": ""}
+        self.assertEqual(self.client.post('/user/fix', data=fix, content_type='application/json').json()["code"], 0)
+        res = self.client.post('/user', data=self.data, content_type='application/json')
+        self.assertEqual(res.json()["nickName"], "Maru")
+
+        self.client.post('/user/close', data=self.data, content_type='application/json')
+        res = self.client.post('/user', data=self.data, content_type='application/json')
+        self.assertEqual(res.status_code, 401)
+
+    def test_profile_kinds(self):
+        info = get_cached_profile("Ashitemaru", "info", lambda user: {"name": user.name})
+        profile = get_cached_profile("Ashitemaru", "profile", User.serialize)
+        self.assertEqual(json.loads(info), {"name": "Ashitemaru"})
+        self.assertEqual(json.loads(profile)["nick_name"], "Ashitemaru")
+        self.assertIsNone(get_cached_profile("Nobody", "info", User.serialize))
+
+
+class PasswordTests(TestCase):
+    # Initializer
+    def _login(self, password="123456"):
+        return self.client.post('/login', data={"userName": "Ashitemaru", "password": password}, content_type='application/json')
+
+    # ! Test section
+    def test_register_stores_hash(self):
+        self.client.post('/register', data={"userName": "Ashitemaru", "password": "123456"}, content_type='application/json')
+        encoded = User.objects.get(name="Ashitemaru").password
+        self.assertTrue(encoded.startswith("pbkdf2_sha256$1000$"))
+        self.assertEqual(self._login().json()["code"], 0)
+        self.assertEqual(self._login("654321").json()["code"], 2)
+
+    def test_plaintext_rehashed_on_login(self):
+        User.objects.create(name="Ashitemaru", password="123456")
+        self.assertEqual(self._login("654321").json()["code"], 2)
+        self.assertEqual(User.objects.get(name="Ashitemaru").password, "123456") # 密码错误时不更新
+        self.assertEqual(self._login().json()["code"], 0)
+        self.assertTrue(User.objects.get(name="Ashitemaru").password.startswith("pbkdf2_sha256$"))
+        self.assertEqual(self._login().json()["code"], 0)
+
+    def test_rehash_when_cost_changes(self):
+        User.objects.create(name="Ashitemaru", password=hash_password("123456"))
+        with override_settings(PASSWORD_HASH_ITERATIONS=2000):
+            self.assertEqual(self._login().json()["code"], 0)
+        self.assertTrue(User.objects.get(name="Ashitemaru").password.startswith("pbkdf2_sha256$2000$"))
+
+    def test_verify_password(self):
+        self.assertEqual(verify_password("123456", hash_password("123456")), (True, None))
+        self.assertEqual(verify_password("123456", hash_password("654321")), (False, None))
+        valid, rehashed = verify_password("123456", "123456")
+        self.assertTrue(valid)
+        self.assertTrue(verify_password("123456", rehashed)[0])
+
+    def test_async_view_errors(self):
+        res = self.client.post('/login', data={"userName": "Ashitemaru"}, content_type='application/json')
+        self.assertEqual(res.status_code, 400)
+        self.assertEqual(res.json()["info"], "Missing or error type of [password]")
+
+
+class RateLimitTests(TestCase):
+    # Initializer
+    def setUp(self):
+        User.objects.create(name="Ashitemaru", password=hash_password("123456"))
+
+    def _login(self, user_name="Ashitemaru", **extra):
+        return self.client.post('/login', data={"userName": user_name, "password": "654321"}, content_type='application/json', **extra)
+
+    # ! Test section
+    def test_login_limited_per_user_name(self):
+        for _ in range(10):
+            self.assertEqual(self._login().status_code, 401)
+        with self.assertNumQueries(0): # 超出限制时不查询数据库
+            res = self._login()
+        self.assertEqual(res.status_code, 429)
+        self.assertEqual(res.json()["code"], -5)
+        self.assertGreaterEqual(int(res["Retry-After"]), 1)
+        self.assertEqual(self._login("Other").status_code, 401) # 其他用户名不受影响
+
+    def test_login_limited_per_converted_user_name(self):
+        User.objects.create(name="12345", password=hash_password("123456"))
+        for i in range(10):
+            self.assertEqual(self._login(12345, REMOTE_ADDR=f"10.0.0.{i}").status_code, 401)
+        self.assertEqual(self._login("12345", REMOTE_ADDR="10.0.1.1").status_code, 429)
+
+    def test_login_limited_per_ip(self):
+        for i in range(60):
+            self._login(f"User{i}")
+        self.assertEqual(self._login("Someone").status_code, 429)
+        self.assertEqual(self._login("Someone", REMOTE_ADDR="10.0.0.2").status_code, 401)
+
+    def test_register_limited_per_ip(self):
+        for i in range(20):
+            self.assertEqual(self.client.post('/register', data={"userName": f"User{i}", "password": "123456"}, content_type='application/json').status_code, 200)
+        res = self.client.post('/register', data={"userName": "One more", "password": "123456"}, content_type='application/json')
+        self.assertEqual(res.status_code, 429)
+        self.assertFalse(User.objects.filter(name="One more").exists())
+
+    def test_token_bucket_refill(self):
+        for backend in (LocalBackend(), CacheBackend()):
+            self.assertEqual(backend.consume("key", 1.0, 2), 0)
+            self.assertEqual(backend.consume("key", 1.0, 2), 0)
+            self.assertGreater(backend.consume("key", 1.0, 2), 0)
+            with mock.patch("time.monotonic", return_value=time.monotonic() + 1), mock.patch("time.time", return_value=time.time() + 1):
+                self.assertEqual(backend.consume("key", 1.0, 2), 0)
+
+    @override_settings(RATE_LIMIT={"BACKEND": "utils.utils_ratelimit.CacheBackend", "OPTIONS": {"cache": "default"}})
+    def test_cache_backend(self):
+        reset_rate_limits()
+        for _ in range(10):
+            self._login()
+        reset_rate_limits() # 模拟另一个工作进程：共享缓存中的计数仍然有效
+        self.assertEqual(self._login().status_code, 429)
+
+
 class CloseTests(TestCase):
     # Initializer
     # ! Test section
@@ -209,4 +349,231 @@ class UserTestCase(TestCase):
     def test_user_serialize(self):
         """测试 User 模型的 serialize 方法"""
         serialized_data = self.user.serialize()
-        self.assertEqual(serialized_data['email'], 'test@example.com')
\ No newline at end of file
+        self.assertEqual(serialized_data['email'], 'test@example.com')
+
+
+class JwtTests(TestCase):
+
+    def setUp(self):
+        utils_jwt.clear_jwt_cache()
+
+    def test_check_token(self):
+        token = generate_jwt_token("Ashitemaru")
+        self.assertEqual(check_jwt_token(token), {"username": "Ashitemaru"})
+        # 第二次命中缓存
+        self.assertEqual(check_jwt_token(token), {"username": "Ashitemaru"})
+        self.assertIn(token.split(".")[2], utils_jwt._verify_cache)
+
+    def test_tampered_token_with_cached_signature(self):
+        token = generate_jwt_token("Ashitemaru")
+        check_jwt_token(token)
+        header_b64, _, signature_b64 = token.split(".")
+        payload = {"iat": int(time.time()), "exp": int(time.time()) + EXPIRE_IN_SECONDS, "data": {"username": "Admin"}}
+        forged = header_b64 + "." + b64url_encode(json.dumps(payload, separators=(",", ":"))) + "." + signature_b64
+        self.assertIsNone(check_jwt_token(forged))
+
+    def test_expired_token(self):
+        token = generate_jwt_token("Ashitemaru")
+        self.assertIsNotNone(check_jwt_token(token))
+        with mock.patch("utils.utils_jwt.time.time", return_value=time.time() + EXPIRE_IN_SECONDS + 1):
+            self.assertIsNone(check_jwt_token(token))
+
+    def test_malformed_token(self):
+        self.assertIsNone(check_jwt_token("not-a-token"))
+        self.assertIsNone(check_jwt_token("a.b.c"))
+
+    def test_cache_is_bounded(self):
+        with mock.patch("utils.utils_jwt.VERIFY_CACHE_SIZE", 2):
+            for name in ("a", "b", "c"):
+                check_jwt_token(generate_jwt_token(name))
+        self.assertEqual(len(utils_jwt._verify_cache), 2)
+
+
+class AuthenticationMiddlewareTests(TestCase):
+
+    def setUp(self):
+        data = {"userName": "Ashitemaru", "password": "123456"}
+        self.token = self.client.post('/register', data=data, content_type='application/json').json()["token"]
+
+    def test_token_resolves_user(self):
+        res = self.client.post('/user', data={}, content_type='application/json', HTTP_AUTHORIZATION="Bearer " + self.token)
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(res.json()["userName"], "Ashitemaru")
+
+    def test_user_loaded_once_and_cached(self):
+        with self.assertNumQueries(1):
+            self.client.post('/user', data={}, content_type='application/json', HTTP_AUTHORIZATION=self.token)
+        with self.assertNumQueries(0):
+            self.client.post('/user', data={}, content_type='application/json', HTTP_AUTHORIZATION=self.token)
+
+    def test_cache_invalidated_on_update(self):
+        self.client.post('/user', data={}, content_type='application/json', HTTP_AUTHORIZATION=self.token)
+        user = User.objects.get(name="Ashitemaru")
+        user.location = "Beijing"
+        user.save()
+        res = self.client.post('/user', data={}, content_type='application/json', HTTP_AUTHORIZATION=self.token)
+        self.assertEqual(res.json()["location"], "Beijing")
+
+    def test_invalid_token(self):
+        res = self.client.post('/user', data={"userName": "Ashitemaru"}, content_type='application/json', HTTP_AUTHORIZATION="Bearer bad.token.value")
+        self.assertEqual(res.status_code, 401)
+        self.assertEqual(res.json()['code'], -4)
+
+    def test_invalid_token_can_login(self):
+        data = {"userName": "Ashitemaru", "password": "123456"}
+        res = self.client.post('/login', data=data, content_type='application/json', HTTP_AUTHORIZATION="Bearer x.y.z")
+        self.assertEqual(res.status_code, 200)
+        res = self.client.post('/register', data={"userName": "Bob", "password": "123456"}, content_type='application/json', HTTP_AUTHORIZATION="Bearer x.y.z")
+        self.assertEqual(res.status_code, 200)
+
+    def test_update_keeps_other_columns(self):
+        self.client.post('/user', data={}, content_type='application/json', HTTP_AUTHORIZATION=self.token) # 缓存用户
+        User.objects.filter(name="Ashitemaru").update(password="changed", location="Beijing")
+        data = {key: "" for key in ("nickName", "phone", "email", "gender", "portrait", "introduction", "birthday", "age", "location")}
+        data["nickName"] = "Ash"
+        self.client.post('/user/fix', data=data, content_type='application/json', HTTP_AUTHORIZATION=self.token)
+        user = User.objects.get(name="Ashitemaru")
+        self.assertEqual((user.nick_name, user.password, user.location), ("Ash", "changed", "Beijing"))
+
+    def test_token_of_closed_user(self):
+        self.client.post('/user/close', data={}, content_type='application/json', HTTP_AUTHORIZATION=self.token)
+        res = self.client.post('/user', data={}, content_type='application/json', HTTP_AUTHORIZATION=self.token)
+        self.assertEqual(res.status_code, 401)
+
+
+class SchemaTests(TestCase):
+
+    SCHEMA = Schema(
+        Field("userName", "string", err_msg="Missing or error type of [userName]"),
+        Field("age", "int"),
+        Field("tags", "list", required=False, default=[]),
+    )
+
+    def test_validate(self):
+        data = self.SCHEMA.validate({"userName": "Ashitemaru", "age": "34"})
+        self.assertEqual(data, {"userName": "Ashitemaru", "age": 34, "tags": []})
+
+    def test_validate_errors_match_require(self):
+        for params in ({"age": 1}, {"userName": "Ashitemaru", "age": "x"}, {"userName": "Ashitemaru", "age": 1, "tags": "x"}):
+            with self.assertRaises(KeyError) as schema_error:
+                self.SCHEMA.validate(params)
+            with self.assertRaises(KeyError) as require_error:
+                require(params, "userName", "string", err_msg="Missing or error type of [userName]")
+                require(params, "age", "int")
+                require(params, "tags", "list")
+            self.assertEqual(schema_error.exception.args, require_error.exception.args)
+
+    def test_body_parsed_once(self):
+        req = HttpRequest()
+        req._body = b'{"userName": "Ashitemaru"}'
+        body = parse_body(req)
+        self.assertIs(parse_body(req), body)
+
+    def test_invalid_body(self):
+        res = self.client.post('/login', data="not json", content_type='application/json')
+        self.assertEqual(res.status_code, 400)
+        self.assertEqual(res.json()['code'], -2)
+        self.assertEqual(res.json()['info'], 'Invalid request body')
+
+
+class RendererTests(TestCase):
+
+    DATA = {
+        "userName": "Ashitemaru",
+        "createTime": datetime.datetime(2024, 1, 1, 8, 30, 15, 123456, tzinfo=datetime.timezone.utc),
+        "birthday": datetime.date(1990, 1, 1),
+        "nickName": "阿",
+        "friends": [{"age": None, "gender": 2}],
+    }
+
+    def _renderers(self):
+        renderers = [StdlibRenderer()]
+        if utils_request.orjson is not None:
+            renderers.append(OrjsonRenderer())
+        return renderers
+
+    def test_renderers_agree(self):
+        expected = {
+            **self.DATA,
+            "createTime": "2024-01-01T08:30:15.123Z",
+            "birthday": "1990-01-01",
+        }
+        for renderer in self._renderers():
+            self.assertEqual(json.loads(renderer.dumps(self.DATA)), expected)
+        if utils_request.orjson is not None: # 两种渲染器输出逐字节一致
+            self.assertEqual(StdlibRenderer().dumps(self.DATA), OrjsonRenderer().dumps(self.DATA))
+
+    def test_datetimes_match_django_encoder(self):
+        values = [
+            self.DATA["createTime"], datetime.datetime(2024, 1, 1, 8, 30), datetime.datetime(2024, 1, 1, 8, 30, 0, 5000),
+            datetime.datetime(2024, 1, 1, 16, 30, 15, 999999, tzinfo=datetime.timezone(datetime.timedelta(hours=8))),
+            datetime.date(1990, 1, 1), datetime.time(8, 30, 15, 123456),
+        ]
+        for renderer in self._renderers():
+            for value in values:
+                self.assertEqual(renderer.dumps([value]), json.dumps([value], cls=DjangoJSONEncoder).encode())
+
+    def test_request_success_envelope(self):
+        for renderer in self._renderers():
+            with mock.patch("utils.utils_request.RENDERER", renderer):
+                res = request_success(self.DATA)
+                body = json.loads(res.content)
+                self.assertEqual(body["code"], 0)
+                self.assertEqual(body["info"], "Succeed")
+                self.assertEqual(body["createTime"], "2024-01-01T08:30:15.123Z")
+                self.assertEqual(res["Content-Type"], "application/json")
+                self.assertEqual(res["Access-Control-Allow-Origin"], "*")
+                self.assertEqual(json.loads(request_success().content), {"code": 0, "info": "Succeed"})
+                # data 中的 info 覆盖默认值，且不产生重复键
+                res = request_success({"info": "User closed"})
+                self.assertEqual(res.content.count(b'"info"'), 1)
+                self.assertEqual(json.loads(res.content)["info"], "User closed")
+                # 预先序列化的 JSON
+                self.assertEqual(json.loads(request_success_json(b'{"a":1}').content), {"code": 0, "info": "Succeed", "a": 1})
+                self.assertEqual(json.loads(request_success_json(b'{}').content), {"code": 0, "info": "Succeed"})
+                self.assertEqual(json.loads(extend_json(b'{"a":1}', b=b'[2]', c=b'{}')), {"a": 1, "b": [2], "c": {}})
+                self.assertEqual(json.loads(extend_json(b'{}', b=b'null')), {"b": None})
+
+
+class DatabaseTests(TestCase):
+
+    def setUp(self):
+        self.router = ReplicaRouter()
+
+    @override_settings(DATABASE_REPLICAS=["replica1", "replica2"])
+    def test_reads_in_read_only_views_use_replicas(self):
+        read_db = use_replica(lambda: self.router.db_for_read(User))
+        self.assertIn(read_db(), ["replica1", "replica2"])
+        # 视图之外以及所有写操作都走主库
+        self.assertEqual(self.router.db_for_read(User), "default")
+        self.assertEqual(use_replica(lambda: self.router.db_for_write(User))(), "default")
+
+    @override_settings(DATABASE_REPLICAS=[f"replica{i}" for i in range(10)])
+    def test_one_replica_per_request(self):
+        read_dbs = use_replica(lambda: {self.router.db_for_read(User) for _ in range(50)})
+        for _ in range(5):
+            self.assertEqual(len(read_dbs()), 1)
+
+    @override_settings(DATABASE_REPLICAS=[])
+    def test_without_replicas(self):
+        self.assertEqual(use_replica(lambda: self.router.db_for_read(User))(), "default")
+
+    def test_database_from_env(self):
+        from DjangoHW.settings import database_from_env
+        with mock.patch.dict("os.environ", {"DB_REPLICA_NAME": "replica.sqlite3", "DB_CONN_MAX_AGE": "30"}):
+            primary = database_from_env("DB_")
+            replica = database_from_env("DB_REPLICA_", {**primary, "HOST": "db-primary"})
+        self.assertEqual(replica["NAME"], "replica.sqlite3")
+        self.assertEqual(replica["ENGINE"], primary["ENGINE"])
+        self.assertEqual(replica["HOST"], "db-primary")
+        self.assertEqual(replica["CONN_MAX_AGE"], 30)
+        self.assertTrue(replica["CONN_HEALTH_CHECKS"])
+
+    @override_settings(SQLITE_PRAGMAS={"cache_size": -1234, "busy_timeout": 4321})
+    def test_sqlite_pragmas(self):
+        configure_sqlite(sender=connection.__class__, connection=connection)
+        with connection.cursor() as cursor:
+            cursor.execute("PRAGMA cache_size")
+            self.assertEqual(cursor.fetchone()[0], -1234)
+            cursor.execute("PRAGMA busy_timeout")
+            self.assertEqual(cursor.fetchone()[0], 4321)
@@ -1,30 +1,54 @@
-import json
 from django.http import HttpRequest, HttpResponse
 from django.shortcuts import redirect
 from user.models import User
+from user.cache import get_cached_profile
+from user.passwords import acheck_user_password, hash_password
 from friend.models import FriendRequest, Friendship
-from utils.utils_request import BAD_METHOD, request_failed, request_success, return_field
-from utils.utils_require import MAX_CHAR_LENGTH, CheckRequire, require
+from user.middleware import get_request_user, get_request_user_name, token_optional
+from utils.utils_request import BAD_METHOD, request_failed, request_success, request_success_json, return_field
+from utils.utils_ratelimit import rate_limit
+from utils.utils_require import MAX_CHAR_LENGTH, CheckRequire, Field, Schema, parse_body, require
 from utils.utils_time import get_timestamp
 from utils.utils_jwt import generate_jwt_token, check_jwt_token
 
 # return_field函数根据提供的字段列表过滤出所需数据
 
+# 请求体校验规则，导入时构建一次
+LOGIN_SCHEMA = Schema(
+    Field("userName", "string", err_msg="Missing or error type of [userName]"),
+    Field("password", "string", err_msg="Missing or error type of [password]"),
+)
+FIX_USER_INFO_SCHEMA = Schema(
+    Field("nickName", "string", err_msg="Missing or error type of [nickname]"),
+    Field("phone", "string", err_msg="Missing or error type of [phone]"),
+    Field("email", "string", err_msg="Missing or error type of [email]"),
+    Field("gender", "string", err_msg="Missing or error type of [gender]"), # gender为枚举类型
+    Field("portrait", "string", err_msg="Missing or error type of [portrait]"),
+    Field("introduction", "string", err_msg="Missing or error type of [introduction]"),
+    Field("birthday", "string", err_msg="Missing or error type of [birthday]"),
+    Field("age", "string", err_msg="Missing or error type of [age]"),
+    Field("location", "string", err_msg="Missing or error type of [location]"),
+)
+
 
 # 登录
+# 异步视图：密码哈希校验在线程池中执行，不阻塞事件循环与工作线程
+# 按 IP 与用户名限流，超出时在查询数据库之前返回 429
+@token_optional
 @CheckRequire
-def login(req: HttpRequest):
+@rate_limit("ip", "60/m")
+@rate_limit("userName", "10/m")
+async def login(req: HttpRequest):
     if req.method != "POST":
         return BAD_METHOD # request_failed(-3, "Bad method", 405)
     
     # Request body example: {"username": "Ashitemaru", "password": "123456"}
-    body = json.loads(req.body.decode("utf-8"))
-    user_name = require(body, "userName", "string", err_msg="Missing or error type of [userName]")
-    password = require(body, "password", "string", err_msg="Missing or error type of [password]")
+    data = LOGIN_SCHEMA.parse(req)
+    user_name, password = data["userName"], data["password"]
 
-    if User.objects.filter(name=user_name).exists(): # 若用户存在
-        user = User.objects.get(name=user_name) # 获取用户名对应的用户实例
-        if user.password == password: # 判断密码是否正确
+    user = await User.objects.filter(name=user_name).only("name", "password").afirst() # 获取用户名对应的用户实例
+    if user is not None: # 若用户存在
+        if await acheck_user_password(user, password): # 判断密码是否正确
             return request_success({"token": generate_jwt_token(user_name)})
         else:
             return request_failed(2, "Wrong password", 401)
@@ -34,39 +58,25 @@ def login(req: HttpRequest):
 # 重定位到聊天列表页
 
 # 注册
+@token_optional
 @CheckRequire
+@rate_limit("ip", "20/m")
 def register(req: HttpRequest):
     if req.method != "POST":
         return BAD_METHOD
-    body = json.loads(req.body.decode("utf-8"))
-    user_name = require(body, "userName", "string", err_msg="Missing or error type of [userName]")
-    password = require(body, "password", "string", err_msg="Missing or error type of [password]")
-    # print(user_name, password)
+    data = LOGIN_SCHEMA.parse(req)
+    user_name, password = data["userName"], data["password"]
     if User.objects.filter(name=user_name).exists():
         return request_failed(1, "User already exists", 409)
     else:
-        user = User(name=user_name, password=password)
+        user = User(name=user_name, password=hash_password(password))
         user.save()
         return request_success({"token": generate_jwt_token(user_name)})
 # 重定位到聊天列表页
 
-# 获取用户个人信息
-@CheckRequire
-def get_user_info(req: HttpRequest):
-    if req.method != "POST":
-        return BAD_METHOD
-    
-    body = json.loads(req.body.decode("utf-8"))
-    user_name = require(body, "userName", "string", err_msg="Missing or error type of [userName]")
-    
-    if not User.objects.filter(name=user_name).exists():
-        return request_failed(1, "User not exist", 401)
-    
-    # 查找数据库中对应用户，并返回其信息
-    user = User.objects.get(name=user_name)
-    
-    # 返回用户信息
-    user_info = {
+# 用户个人信息
+def _user_info(user: User):
+    return {
         "userName": user.name,
         "nickName": user.nick_name,
         "gender": user.gender,
@@ -79,7 +89,20 @@ def get_user_info(req: HttpRequest):
         "age": user.age,
         "location": user.location
     }
-    return request_success(user_info)
+
+# 获取用户个人信息
+@CheckRequire
+def get_user_info(req: HttpRequest):
+    if req.method != "POST":
+        return BAD_METHOD
+    
+    user_name = get_request_user_name(req, parse_body(req))
+    
+    # 从资料缓存取序列化好的用户信息（fix_user_info / close 后由信号失效）
+    user_info = get_cached_profile(user_name, "info", _user_info)
+    if user_info is None:
+        return request_failed(1, "User not exist", 401)
+    return request_success_json(user_info)
 
 # 修改用户个人信息
 ### TODO:修改用户密码
@@ -102,38 +125,37 @@ def fix_user_info(req: HttpRequest):
     if req.method != "POST":
         return BAD_METHOD
 
-    body = json.loads(req.body.decode("utf-8")) 
-    user_name = require(body, "userName", "string", err_msg="Missing or error type of [userName]") # 不可修改
-    nick_name = require(body, "nickName", "string", err_msg="Missing or error type of [nickname]")
-    phone = require(body, "phone", "string", err_msg="Missing or error type of [phone]")
-    email = require(body, "email", "string", err_msg="Missing or error type of [email]")
-    gender_info = require(body, "gender", "string", err_msg="Missing or error type of [gender]") # gender为枚举类型
+    user_name = get_request_user_name(req, parse_body(req)) # 不可修改
+    data = FIX_USER_INFO_SCHEMA.parse(req)
+    gender_info = data["gender"]
     if gender_info == "male" or gender_info == "男":
         gender = 1
     elif gender_info == "female" or gender_info == "女":
         gender = 2
     else:
         gender = 0
-    portrait = require(body, "portrait", "string", err_msg="Missing or error type of [portrait]")
-    introduction = require(body, "introduction", "string", err_msg="Missing or error type of [introduction]")
-    birthday = require(body, "birthday", "string", err_msg="Missing or error type of [birthday]")
-    age = require(body, "age", "string", err_msg="Missing or error type of [age]")
-    location = require(body, "location", "string", err_msg="Missing or error type of [location]")
     
-    # 查找数据库中对应用户，并进行修改
-    if not User.objects.filter(name=user_name).exists():
+    # 查找对应用户，并进行修改
+    # 缓存中的用户可能已过时（其他进程的修改），只写入本次修改的字段，避免覆盖其他列（如密码）
+    user = get_request_user(req, user_name)
+    if user is None:
         return request_failed(1, "User not exist", 401)
-    user = User.objects.get(name=user_name)
-    if nick_name: user.nick_name = nick_name
-    if phone: user.phone = phone
-    if email: user.email = email
-    if gender: user.gender = gender
-    if portrait: user.portrait = portrait
-    if introduction: user.introduction = introduction
-    if birthday: user.birthday = birthday
-    if age: user.age = age
-    if location: user.location = location
-    user.save()
+    changes = {
+        "nick_name": data["nickName"],
+        "phone": data["phone"],
+        "email": data["email"],
+        "gender": gender,
+        "portrait": data["portrait"],
+        "introduction": data["introduction"],
+        "birthday": data["birthday"],
+        "age": data["age"],
+        "location": data["location"],
+    }
+    changes = {field: value for field, value in changes.items() if value}
+    for field, value in changes.items():
+        setattr(user, field, value)
+    if changes:
+        user.save(update_fields=[*changes, "update_time"])
     return request_success({"token": generate_jwt_token(user_name)})
 
 # 注销
@@ -142,12 +164,11 @@ def close(request: HttpRequest):
     if request.method != "POST":
         return BAD_METHOD
     else:
-        body = json.loads(request.body.decode("utf-8"))
-        user_name = require(body, "userName", "string", err_msg="Missing or error type of [userName]")
+        user_name = get_request_user_name(request, parse_body(request))
         
-        if not User.objects.filter(name=user_name).exists():
+        # 按主键删除，不依赖缓存中可能过时的字段
+        deleted, _ = User.objects.filter(name=user_name).delete()
+        if not deleted:
             return request_failed(1, "User not exist", 401)
-        user = User.objects.get(name=user_name)
-        user.delete()
         return request_success({"info": "User closed","token": generate_jwt_token(user_name)})
 # 重定位到登录页
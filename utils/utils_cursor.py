@@ -0,0 +1,37 @@
+import datetime
+import json
+
+from utils.utils_jwt import b64url_decode, b64url_encode
+from utils.utils_require import require
+
+# Opaque cursors for keyset pagination.
+# A cursor encodes the sort key of the last returned row, e.g. (sent_at, id);
+# the next page continues strictly after it instead of using OFFSET.
+
+
+def encode_cursor(*values):
+    return b64url_encode(json.dumps([
+        {"dt": v.isoformat()} if isinstance(v, datetime.datetime) else v for v in values
+    ], separators=(",", ":")))
+
+
+# Raise KeyError so that `CheckRequire` answers with a 400 in the usual shape
+def decode_cursor(cursor, size, err_msg="Bad param [cursor]", err_code=-1):
+    try:
+        values = json.loads(b64url_decode(cursor))
+        assert isinstance(values, list) and len(values) == size
+        return [
+            datetime.datetime.fromisoformat(v["dt"]) if isinstance(v, dict) else v for v in values
+        ]
+    except Exception:
+        raise KeyError(err_msg, err_code)
+
+
+# Page size from the `limit` parameter, bounded to (0, maximum]
+def get_page_size(params, default, maximum):
+    if "limit" not in params:
+        return default
+    limit = require(params, "limit", "int", err_msg="Bad param [limit]", err_code=-1)
+    if not 0 < limit <= maximum:
+        raise KeyError("Bad param [limit]", -1)
+    return limit
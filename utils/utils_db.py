@@ -0,0 +1,53 @@
+import contextvars
+import random
+from functools import wraps
+
+from django.conf import settings
+
+# Read replica routing.
+# Views decorated with `use_replica` send their reads to one of the aliases in
+# `settings.DATABASE_REPLICAS`; everything else, and every write, goes to "default".
+# The replica is picked once per request, so all reads of a request (e.g. an ETag and
+# the page it describes) see the same replica and the same replication lag.
+
+_replica_alias = contextvars.ContextVar("replica_alias", default=None)
+
+
+def use_replica(view_fn):
+    @wraps(view_fn)
+    def decorated(*args, **kwargs):
+        replicas = getattr(settings, "DATABASE_REPLICAS", None)
+        token = _replica_alias.set(random.choice(replicas) if replicas else None)
+        try:
+            return view_fn(*args, **kwargs)
+        finally:
+            _replica_alias.reset(token)
+    return decorated
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        return _replica_alias.get() or "default"
+
+    def db_for_write(self, model, **hints):
+        return "default"
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the same data as the primary
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return None
+
+
+# SQLite connection tuning.
+# Applied to every new SQLite connection from `settings.SQLITE_PRAGMAS`, e.g. WAL journal
+# mode so readers don't block the writer, and busy_timeout so a writer waits for the lock
+# instead of failing with "database is locked".
+def configure_sqlite(sender, connection, **kwargs):
+    if connection.vendor != "sqlite":
+        return
+    pragmas = getattr(settings, "SQLITE_PRAGMAS", None) or {}
+    with connection.cursor() as cursor:
+        for name, value in pragmas.items():
+            cursor.execute("PRAGMA %s = %s" % (name, value))
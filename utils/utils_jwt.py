@@ -1,9 +1,11 @@
 import datetime
 import hashlib
 import hmac
+import threading
 import time
 import json
 import base64
+from collections import OrderedDict
 from typing import Optional
 
 # c.f. https://thuse-course.github.io/course-index/basic/jwt/#jwt
@@ -11,6 +13,14 @@ from typing import Optional
 SALT = ("KawaiiNana" + datetime.datetime.now().strftime("%Y%m%d%H%M")).encode("utf-8")
 EXPIRE_IN_SECONDS = 60 * 60 * 24 * 1  # 1 day
 ALT_CHARS = "-_".encode("utf-8")
+VERIFY_CACHE_SIZE = 4096  # Max number of verified tokens kept per process
+
+# HMAC state keyed with SALT, computed once and copied for every signature
+_HMAC_BASE = hmac.new(SALT, digestmod=hashlib.sha256)
+
+# signature -> (token, exp, data), least recently used first
+_verify_cache = OrderedDict()
+_verify_cache_lock = threading.Lock()
 
 
 def b64url_encode(s):
@@ -50,33 +60,67 @@ def generate_jwt_token(username: str):
     payload_b64 = b64url_encode(payload_str)
     
     # * signature
-    signature_raw = header_b64 + "." + payload_b64
-    signature = hmac.new(SALT, signature_raw.encode("utf-8"), digestmod=hashlib.sha256).digest()
-    signature_b64 = b64url_encode(signature)
+    signature_b64 = sign(header_b64 + "." + payload_b64)
     
     return header_b64 + "." + payload_b64 + "." + signature_b64
 
 
-def check_jwt_token(token: str) -> Optional[dict]:
+def sign(signature_raw: str) -> str:
+    mac = _HMAC_BASE.copy()
+    mac.update(signature_raw.encode("utf-8"))
+    return b64url_encode(mac.digest())
+
+
+# Verify signature and decode claims, returns (exp, data) or None
+def _verify_jwt_token(token: str):
     # * Split token
     try:
         header_b64, payload_b64, signature_b64 = token.split(".")
     except:
         return None
 
-    payload_str = b64url_decode(payload_b64)
-    
     # * Check signature
-    signature_str_check = header_b64 + "." + payload_b64
-    signature_check = hmac.new(SALT, signature_str_check.encode("utf-8"), digestmod=hashlib.sha256).digest()
-    signature_b64_check = b64url_encode(signature_check)
-    
-    if signature_b64_check != signature_b64:
+    signature_b64_check = sign(header_b64 + "." + payload_b64)
+    if not hmac.compare_digest(signature_b64_check, signature_b64):
+        return None
+
+    try:
+        payload = json.loads(b64url_decode(payload_b64))
+        return payload["exp"], payload["data"]
+    except:
+        return None
+
+
+def check_jwt_token(token: str) -> Optional[dict]:
+    now = time.time()
+    signature_b64 = token.rpartition(".")[2]
+
+    # Verified tokens are cached until they expire
+    with _verify_cache_lock:
+        cached = _verify_cache.get(signature_b64)
+        if cached is not None and cached[0] == token:
+            if cached[1] < now:
+                del _verify_cache[signature_b64]
+                return None
+            _verify_cache.move_to_end(signature_b64)
+            return dict(cached[2])
+
+    verified = _verify_jwt_token(token)
+    if verified is None:
         return None
     
     # Check expire
-    payload = json.loads(payload_str)
-    if payload["exp"] < time.time():
+    exp, data = verified
+    if exp < now:
         return None
     
-    return payload["data"]
+    with _verify_cache_lock:
+        _verify_cache[signature_b64] = (token, exp, data)
+        if len(_verify_cache) > VERIFY_CACHE_SIZE:
+            _verify_cache.popitem(last=False)
+    return dict(data)
+
+
+def clear_jwt_cache():
+    with _verify_cache_lock:
+        _verify_cache.clear()
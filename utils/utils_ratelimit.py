@@ -0,0 +1,149 @@
+import asyncio
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import caches
+from django.utils.module_loading import import_string
+
+from utils.utils_request import request_failed
+from utils.utils_require import _to_string, parse_body
+
+# Token bucket rate limiting.
+# Every (scope, key) pair owns a bucket holding up to `burst` tokens that refills at
+# `rate` tokens per second; a request takes one token and is rejected with 429 when
+# the bucket is empty. Buckets are kept by the backend configured in
+# `settings.RATE_LIMIT`:
+#   LocalBackend  per process, no I/O
+#   CacheBackend  a Django cache shared by all worker processes (e.g. memcached / redis)
+
+PERIODS = {"s": 1, "m": 60, "h": 3600, "d": 86400}
+
+
+# "10/m" -> 10 / 60 tokens per second
+def parse_rate(rate):
+    count, period = rate.split("/")
+    return int(count) / PERIODS[period], int(count)
+
+
+def _refill(state, rate, burst, now):
+    if state is None:
+        return float(burst)
+    tokens, updated = state
+    return min(float(burst), tokens + (now - updated) * rate)
+
+
+class LocalBackend:
+    def __init__(self, max_keys=100000):
+        self.max_keys = max_keys
+        self._buckets = OrderedDict()  # key -> (tokens, updated)
+        self._lock = threading.Lock()
+
+    # Take one token; returns 0 when allowed, otherwise the seconds until a token is available
+    def consume(self, key, rate, burst):
+        now = time.monotonic()
+        with self._lock:
+            tokens = _refill(self._buckets.get(key), rate, burst, now)
+            allowed = tokens >= 1
+            self._buckets[key] = (tokens - 1 if allowed else tokens, now)
+            self._buckets.move_to_end(key)
+            if len(self._buckets) > self.max_keys:  # Evicted keys start over with a full bucket
+                self._buckets.popitem(last=False)
+        return 0 if allowed else (1 - tokens) / rate
+
+
+class CacheBackend:
+    # Read-modify-write without a lock: concurrent requests may both take the last token,
+    # which is acceptable for throttling abuse
+    KEY_PREFIX = "ratelimit:"
+
+    def __init__(self, cache="default"):
+        self.cache = caches[cache]
+
+    def consume(self, key, rate, burst):
+        now = time.time()
+        cache_key = self.KEY_PREFIX + hashlib.md5(key.encode("utf-8")).hexdigest()
+        tokens = _refill(self.cache.get(cache_key), rate, burst, now)
+        allowed = tokens >= 1
+        # An untouched bucket is full again after burst / rate seconds
+        self.cache.set(cache_key, (tokens - 1 if allowed else tokens, now), timeout=int(burst / rate) + 1)
+        return 0 if allowed else (1 - tokens) / rate
+
+
+_backend = None
+_backend_lock = threading.Lock()
+
+
+def get_backend():
+    global _backend
+    with _backend_lock:
+        if _backend is None:
+            config = getattr(settings, "RATE_LIMIT", {})
+            backend = import_string(config.get("BACKEND", "utils.utils_ratelimit.LocalBackend"))
+            _backend = backend(**config.get("OPTIONS", {}))
+        return _backend
+
+
+# Drop the backend so it is rebuilt from settings (a new LocalBackend starts with full buckets)
+def reset_rate_limits():
+    global _backend
+    with _backend_lock:
+        _backend = None
+
+
+# Rate limit keys, computed from the request without touching the database
+def _client_ip(req):
+    header = getattr(settings, "RATE_LIMIT", {}).get("IP_HEADER")  # e.g. HTTP_X_REAL_IP behind a proxy
+    return (header and req.META.get(header)) or req.META.get("REMOTE_ADDR", "")
+
+
+def _request_key(req, key):
+    if key == "ip":
+        return _client_ip(req)
+    try:
+        value = parse_body(req).get(key)
+    except KeyError:  # Invalid body, left for the view to report
+        return None
+    # Same conversion as a "string" Field, so {"userName": 12345} shares the bucket of "12345"
+    return _to_string(value) if value is not None else None
+
+
+# A decorator limiting a view by client IP (key="ip") or by a field of the request body,
+# e.g. @rate_limit("userName", "10/m"). Place it below CheckRequire; works for sync and async views.
+def rate_limit(key, rate, burst=None):
+    tokens_per_second, count = parse_rate(rate)
+    burst = burst or count
+
+    def check(req, view_name):
+        value = _request_key(req, key)
+        if value is None:
+            return None
+        retry_after = get_backend().consume(f"{view_name}:{key}:{value}", tokens_per_second, burst)
+        if not retry_after:
+            return None
+        response = request_failed(-5, "Too many requests", 429)
+        response["Retry-After"] = str(int(retry_after) + 1)
+        return response
+
+    def decorator(view_fn):
+        view_name = view_fn.__name__
+        if asyncio.iscoroutinefunction(view_fn):
+            @wraps(view_fn)
+            async def async_decorated(req, *args, **kwargs):
+                response = check(req, view_name)
+                if response is not None:
+                    return response
+                return await view_fn(req, *args, **kwargs)
+            return async_decorated
+
+        @wraps(view_fn)
+        def decorated(req, *args, **kwargs):
+            response = check(req, view_name)
+            if response is not None:
+                return response
+            return view_fn(req, *args, **kwargs)
+        return decorated
+    return decorator
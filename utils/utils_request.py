@@ -1,27 +1,97 @@
-from django.http import JsonResponse
+import datetime
+import json
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import HttpResponse, HttpResponseNotModified
+
+try:  # Fast path for rendering when available
+    import orjson
+except ImportError:
+    orjson = None
+
+
+# Values JSON has no type for (date / time, Decimal, UUID, ...) are rendered exactly as
+# DjangoJSONEncoder did before the renderers existed: ISO 8601 with millisecond precision
+# and "Z" for UTC. orjson is told to pass date / time values through to this function.
+_ENCODER = DjangoJSONEncoder()
+
+
+def _default(o):
+    return _ENCODER.default(o)
+
+
+# A date / time value formatted like in JSON responses, for other output formats (e.g. CSV)
+def format_datetime(value):
+    return _default(value)
+
+
+# Response renderers turn `data` into JSON bytes
+class StdlibRenderer:
+    def dumps(self, data):
+        return json.dumps(data, default=_default, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+class OrjsonRenderer:
+    OPTIONS = orjson.OPT_PASSTHROUGH_DATETIME if orjson is not None else 0
+
+    def dumps(self, data):
+        return orjson.dumps(data, default=_default, option=self.OPTIONS)
+
+
+RENDERER = OrjsonRenderer() if orjson is not None else StdlibRenderer()
+
+
+def dumps_json(data):
+    return RENDERER.dumps(data)
+
+
+# The constant envelope of a successful response, pre-encoded
+_SUCCESS_PREFIX = b'{"code":0,"info":"Succeed"'
+
+
+def _json_response(content, status_code):
+    response = HttpResponse(content, content_type="application/json", status=status_code)
+    response["Access-Control-Allow-Origin"] = "*"
+    return response
 
 
 def request_failed(code, info, status_code=400):
-    return JsonResponse({
+    return _json_response(RENDERER.dumps({
         "code": code,
         "info": info,
-        },
-        headers={
-            "Access-Control-Allow-Origin": "*"
-        },
-      status=status_code)
+    }), status_code)
 
 
 def request_success(data={}, status_code=200):
-    return JsonResponse({
-        "code": 0,
-        "info": "Succeed",
-        **data
-    },
-    headers={
+    if not data:
+        return _json_response(_SUCCESS_PREFIX + b"}", status_code)
+    if "code" in data or "info" in data:  # `data` overrides the envelope
+        return _json_response(RENDERER.dumps({"code": 0, "info": "Succeed", **data}), status_code)
+    # Splice the rendered data after the envelope: {"code":0,"info":"Succeed", ...data}
+    return _json_response(_SUCCESS_PREFIX + b"," + RENDERER.dumps(data)[1:], status_code)
+
+
+# Respond with a pre-rendered JSON object (e.g. from a cache) inside the success envelope
+def request_success_json(content, status_code=200):
+    if content == b"{}":
+        return _json_response(_SUCCESS_PREFIX + b"}", status_code)
+    return _json_response(_SUCCESS_PREFIX + b"," + content[1:], status_code)
+
+
+# Add pre-rendered JSON values to a rendered JSON object: extend_json(b'{"a":1}', b=b'[2]') -> b'{"a":1,"b":[2]}'
+def extend_json(content, **values):
+    items = b",".join(RENDERER.dumps(key) + b":" + value for key, value in values.items())
+    if content == b"{}":
+        return b"{" + items + b"}"
+    return content[:-1] + b"," + items + b"}"
+
+
+def request_not_modified(etag):
+    response = HttpResponseNotModified(headers={
         "Access-Control-Allow-Origin": "*"
-    },
-    status=status_code)
+    })
+    response["ETag"] = etag
+    return response
 
 
 def return_field(obj_dict, field_list):
@@ -1,19 +1,40 @@
+import asyncio
+import json
 from functools import wraps
 
 from utils.utils_request import request_failed
 
+try:  # Faster JSON decoder when available
+    import orjson
+    json_loads = orjson.loads
+except ImportError:
+    json_loads = json.loads
+
 MAX_CHAR_LENGTH = 255
 
 # A decorator function for processing `require` in view function.
+# Works for both sync and async (coroutine) views.
 def CheckRequire(check_fn):
+    def failed(e):
+        # Handle exception e
+        error_code = -2 if len(e.args) < 2 else e.args[1]
+        return request_failed(error_code, e.args[0], 400)  # Refer to below
+
+    if asyncio.iscoroutinefunction(check_fn):
+        @wraps(check_fn)
+        async def async_decorated(*args, **kwargs):
+            try:
+                return await check_fn(*args, **kwargs)
+            except Exception as e:
+                return failed(e)
+        return async_decorated
+
     @wraps(check_fn)
     def decorated(*args, **kwargs):
         try:
             return check_fn(*args, **kwargs)
         except Exception as e:
-            # Handle exception e
-            error_code = -2 if len(e.args) < 2 else e.args[1]
-            return request_failed(error_code, e.args[0], 400)  # Refer to below
+            return failed(e)
     return decorated
 
 
@@ -58,5 +79,109 @@ def require(body, key, type="string", err_msg=None, err_code=-2):
         except:
             raise KeyError(err_msg, err_code)
 
+    elif type == "dict":
+        try:
+            assert isinstance(val, dict)
+            return val
+        except:
+            raise KeyError(err_msg, err_code)
+
     else:
-        raise NotImplementedError(f"Type `{type}` not implemented.", err_code)
\ No newline at end of file
+        raise NotImplementedError(f"Type `{type}` not implemented.", err_code)
+
+
+def _to_int(val):
+    return val if type(val) is int else int(val)
+
+
+def _to_float(val):
+    return val if type(val) is float else float(val)
+
+
+def _to_string(val):
+    return val if type(val) is str else str(val)
+
+
+def _to_list(val):
+    assert isinstance(val, list)
+    return val
+
+
+def _to_dict(val):
+    assert isinstance(val, dict)
+    return val
+
+
+_CONVERTERS = {
+    "int": _to_int,
+    "float": _to_float,
+    "string": _to_string,
+    "list": _to_list,
+    "dict": _to_dict,
+}
+
+
+# A field in a request schema, same semantics as `require`.
+# Optional fields that are missing (or null) take `default`.
+class Field:
+    def __init__(self, key, type="string", required=True, default=None, err_msg=None, err_code=-2):
+        if type not in _CONVERTERS:
+            raise NotImplementedError(f"Type `{type}` not implemented.", err_code)
+        self.key = key
+        self.convert = _CONVERTERS[type]
+        self.required = required
+        self.default = default
+        self.missing_msg = err_msg if err_msg is not None \
+            else f"Invalid parameters. Expected `{key}`, but not found."
+        self.type_msg = err_msg if err_msg is not None \
+            else f"Invalid parameters. Expected `{key}` to be `{type}` type."
+        self.err_code = err_code
+
+
+# A declarative request schema, built once per endpoint at import time.
+# `validate` checks every field in one pass and raises KeyError(err_msg, err_code)
+# like `require`, so `CheckRequire` answers in the same `code`/`info` shape.
+class Schema:
+    def __init__(self, *fields):
+        self.fields = tuple(
+            (f.key, f.convert, f.required, f.default, f.missing_msg, f.type_msg, f.err_code) for f in fields
+        )
+
+    def validate(self, params):
+        data = {}
+        for key, convert, required, default, missing_msg, type_msg, err_code in self.fields:
+            val = params.get(key)
+            if val is None:
+                if required and key not in params:
+                    raise KeyError(missing_msg, err_code)
+                if not required:
+                    data[key] = default
+                    continue
+            try:
+                data[key] = convert(val)
+            except Exception:
+                raise KeyError(type_msg, err_code)
+        return data
+
+    # Validate the JSON body of the request
+    def parse(self, req):
+        return self.validate(parse_body(req))
+
+    # Validate the query string of the request
+    def parse_query(self, req):
+        return self.validate(req.GET)
+
+
+# Decode the JSON body once per request, later calls reuse the result.
+# An empty body is treated as `{}`.
+def parse_body(req):
+    body = getattr(req, "_json_body", None)
+    if body is None:
+        try:
+            body = json_loads(req.body) if req.body else {}
+        except ValueError:
+            raise KeyError("Invalid request body", -2)
+        if not isinstance(body, dict):
+            raise KeyError("Invalid request body", -2)
+        req._json_body = body
+    return body